@@ -1,7 +1,9 @@
 from flask import Flask, redirect, url_for
 import logging
+import os
 from config import Config
 from modules.graph import graph_bp
+from modules.graph.embedding_model import embedding_loader
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -12,6 +14,12 @@ def create_app(config_class=Config):
     
     app.register_blueprint(graph_bp)
     
+    # Under `python app.py` the debug reloader's first process only watches
+    # files and never serves requests; the child it starts sets WERKZEUG_RUN_MAIN.
+    reloader_watcher = __name__ == '__main__' and app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+    if app.config.get('EMBEDDING_PRELOAD') and not reloader_watcher:
+        embedding_loader.start()
+    
     app.logger.debug("Registered routes:")
     for rule in app.url_map.iter_rules():
         app.logger.debug(f"{rule.endpoint}: {rule.rule}")
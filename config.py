@@ -5,8 +5,120 @@ class Config:
     DATA_DIR.mkdir(exist_ok=True)
     GRAPH_DATA_FILE = Path("data/concept_graph_data.json")
     
+    # "sqlite" keeps every topic in GRAPH_DB_FILE (GRAPH_DATA_FILE is imported
+    # on first run and stays the import/export format). "journal" keeps one
+    # topic in GRAPH_DATA_FILE and appends each edit to a log next to it;
+    # "snapshot" rewrites GRAPH_DATA_FILE on every edit.
+    GRAPH_STORE = "sqlite"
+    GRAPH_DB_FILE = Path("data/knowledge_map.db")
+    GRAPH_SNAPSHOT_MAX_TOPICS = 8
+    
+    # Loaded topic graphs kept in memory by the graph blueprint.
+    GRAPH_CACHE_MAX_TOPICS = 16
+    GRAPH_CACHE_MAX_CONCEPTS = 500000
+    GRAPH_JOURNAL_COMPACT_EVERY = 200
+    GRAPH_JOURNAL_FSYNC = True
+    
+    # "sentence-transformers" runs EMBEDDING_MODEL as is, "sentence-transformers-int8"
+    # quantizes its Linear layers to int8, and "hashing" is a deterministic
+    # model-free backend for tests and benchmarks (EMBEDDING_HASH_DIM wide).
+    EMBEDDING_BACKEND = "sentence-transformers"
+    EMBEDDING_MODEL = "Alibaba-NLP/gte-Qwen2-7B-instruct"
+    EMBEDDING_HASH_DIM = 384
+    # Texts per forward pass; each similarity request encodes its texts in one call.
+    EMBEDDING_BATCH_SIZE = 32
+    # One worker thread runs every encode. It waits this long after a request
+    # arrives for others to join the batch, up to EMBEDDING_MAX_BATCH texts.
+    EMBEDDING_BATCH_WINDOW_MS = 5
+    EMBEDDING_MAX_BATCH = 128
+    # Start loading the model on a background thread when the app is created;
+    # otherwise it loads on first use. /health/ready reports 503 until it is loaded.
+    EMBEDDING_PRELOAD = True
+    # Vectors already computed for (model, prompt, text) are reused from here
+    # by every worker and across restarts.
+    EMBEDDING_CACHE_ENABLED = True
+    EMBEDDING_CACHE_DIR = Path("data/embeddings")
+    
+    # Per-topic concept vectors for /similar_concepts. Queries scan the matrix
+    # in blocks of VECTOR_INDEX_BLOCK_ROWS; if faiss is installed, topics with at
+    # least VECTOR_INDEX_ANN_MIN_CONCEPTS concepts use an approximate HNSW index.
+    # A topic's index is first built inside the request only up to
+    # VECTOR_INDEX_INLINE_MAX concepts; bigger ones are built in the background.
+    VECTOR_INDEX_MAX_TOPICS = 8
+    VECTOR_INDEX_BLOCK_ROWS = 65536
+    VECTOR_INDEX_ANN_MIN_CONCEPTS = 200000
+    VECTOR_INDEX_INLINE_MAX = 500
+    
+    # /auto_add_term: "embedding" ranks the nearest concepts as parents and only
+    # asks Claude (about those candidates, within PLACEMENT_LLM_TIMEOUT seconds)
+    # when the best one isn't PLACEMENT_MARGIN points ahead; "llm" always asks
+    # Claude with the whole graph.
+    TERM_PLACEMENT = "embedding"
+    PLACEMENT_CANDIDATES = 8
+    PLACEMENT_MIN_SIMILARITY = 40.0
+    PLACEMENT_MARGIN = 5.0
+    PLACEMENT_LLM_TIMEOUT = 10
+    
+    # "Related" links between concepts in different branches: each concept's
+    # RELATED_K nearest neighbours at least RELATED_MIN_SIMILARITY similar,
+    # computed in the background a block of rows at a time so one block of
+    # the similarity matrix stays within RELATED_RAM_BUDGET_MB.
+    RELATED_K = 5
+    RELATED_MIN_SIMILARITY = 55.0
+    RELATED_RAM_BUDGET_MB = 256
+    RELATED_MAX_BLOCK_ROWS = 4096
+    RELATED_DIR = Path("data/related")
+    
+    # Stored layout: a concept starts LAYOUT_LEVEL_RADIUS per level from the
+    # centre (the client's radial force distance); new concepts land within
+    # LAYOUT_SIBLING_SPREAD radians of their parent's direction.
+    LAYOUT_LEVEL_RADIUS = 150
+    LAYOUT_SIBLING_SPREAD = 0.3
+    
+    # New topics are generated breadth-first: the root's children in one
+    # prompt, then every concept expanded in parallel on GENERATION_WORKERS
+    # threads, down to level GENERATION_DEPTH.
+    GENERATION_DEPTH = 3
+    GENERATION_WORKERS = 6
+    GENERATION_MAX_CONCEPTS = 500
+    
+    # Chat context: a graph over CHAT_CONTEXT_TOKEN_BUDGET (estimated) is sent
+    # as an outline of its top CHAT_OUTLINE_LEVELS levels plus, per message,
+    # the CHAT_CONTEXT_SEEDS most relevant concepts with their ancestors and
+    # up to CHAT_CONTEXT_MAX_SIBLINGS siblings each, within the same budget.
+    # The system prompt of the latest version of up to CHAT_CONTEXT_CACHE_SIZE
+    # topics is kept in memory.
+    CHAT_CONTEXT_TOKEN_BUDGET = 2000
+    CHAT_CONTEXT_SEEDS = 12
+    CHAT_CONTEXT_MAX_SIBLINGS = 5
+    CHAT_OUTLINE_LEVELS = 2
+    CHAT_OUTLINE_TOKEN_BUDGET = 1000
+    CHAT_CONTEXT_CACHE_SIZE = 8
+    
     CLAUDE_API_KEY = ""
     CLAUDE_API_URL = "https://api.anthropic.com/v1/messages"
+    CLAUDE_MODEL = "claude-3-opus-20240229"
+    
+    # Shared Claude client: pooled keep-alive connections, per-attempt
+    # timeouts, LLM_MAX_RETRIES jittered retries on 429/5xx, and a circuit
+    # breaker that fails fast for LLM_BREAKER_RESET_SECONDS after
+    # LLM_BREAKER_FAILURES failed calls in a row.
+    LLM_POOL_SIZE = 10
+    LLM_CONNECT_TIMEOUT = 5
+    LLM_READ_TIMEOUT = 60
+    LLM_MAX_RETRIES = 2
+    LLM_BACKOFF_SECONDS = 0.5
+    LLM_BACKOFF_MAX_SECONDS = 8
+    LLM_BREAKER_FAILURES = 5
+    LLM_BREAKER_RESET_SECONDS = 30
+    
+    # Replies to generation and placement prompts, keyed by model, prompt and
+    # max_tokens, reused for LLM_CACHE_TTL_SECONDS; least recently used
+    # entries go once the directory passes LLM_CACHE_MAX_MB.
+    LLM_CACHE_ENABLED = True
+    LLM_CACHE_DIR = Path("data/llm_cache")
+    LLM_CACHE_TTL_SECONDS = 7 * 24 * 3600
+    LLM_CACHE_MAX_MB = 64
     
     DEBUG = True
     PORT = 5001
\ No newline at end of file
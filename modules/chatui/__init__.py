@@ -1,10 +1,15 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, Response, render_template, jsonify, request, stream_with_context
 from config import Config
 import requests
 import logging
 import json
-from modules.graph.utils import build_or_load_graph, prepare_d3_data
-from modules.graph.routes import global_topic, global_data
+import threading
+import time
+from collections import OrderedDict
+from modules.graph.utils import prepare_d3_data, similarity_available, sse_event, vector_indexes
+from modules.graph.routes import default_topic, topic_snapshot
+from modules.graph.embedding_model import EmbeddingModelLoading
+from modules.graph.llm_client import llm_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,42 +23,75 @@ chatui_bp = Blueprint('chatui', __name__,
 def chat():
     return render_template('chat.html')
 
-@chatui_bp.route('/chat/message', methods=['POST'])
-def message():
-    try:
-        message = request.json.get('message')
-        if not message:
-            logger.error("No message provided in request")
-            return jsonify({'status': 'error', 'message': 'No message provided'})
+class ChatError(Exception):
+    """A chat request failed before reaching Claude; the message is shown to the user."""
 
-        logger.info(f"Processing message: {message}")
+context_cache = OrderedDict()
+context_cache_lock = threading.Lock()
 
-        try:
-            with open(Config.GRAPH_DATA_FILE, 'r') as f:
-                graph_data = json.load(f)
-                current_topic = graph_data.get('core', 'Machine Learning')
-        except Exception as e:
-            logger.error(f"Error reading graph data file: {str(e)}")
-            return jsonify({'status': 'error', 'message': 'Error reading graph data'})
+def chat_payload(message):
+    """Messages API payload answering ``message`` with the current graph as context.
 
-        try:
-            graph_data = build_or_load_graph(current_topic, force_regenerate=True, calculate_similarities=False)
-            if not graph_data:
-                logger.error("Failed to load graph data")
-                return jsonify({'status': 'error', 'message': 'Failed to load graph data'})
-            
-            current_topic = graph_data.get('core', current_topic)
-            d3_data = prepare_d3_data(graph_data, using_similarities=False)
-            
-            logger.info(f"Current topic: {current_topic}")
-            logger.info(f"Graph data: {graph_data}")
-        except Exception as e:
-            logger.error(f"Error loading graph data: {str(e)}")
-            return jsonify({'status': 'error', 'message': 'Error loading graph data'})
-        
-        context = format_graph_context(d3_data)
-        
-        system_message = f"""You are a friendly and knowledgeable AI assistant focused on {current_topic}. 
+    The graph is read from the latest snapshot, never regenerated. The
+    first system block (instructions, then the graph or, for a graph over
+    CHAT_CONTEXT_TOKEN_BUDGET, an outline of its top levels) is marked with
+    ``cache_control`` so the upstream can reuse it while the graph version
+    stays the same. For large graphs a second block holds the concepts
+    most relevant to ``message``.
+    """
+    try:
+        # Nothing loaded yet: open the default topic as the graph view would.
+        snapshot = topic_snapshot(default_topic(), create=True)
+    except Exception as e:
+        logger.error(f"Error loading graph data: {str(e)}")
+        raise ChatError('Error loading graph data')
+    
+    if snapshot is None:
+        logger.error("Failed to load graph data")
+        raise ChatError('Failed to load graph data')
+    
+    logger.debug(f"Chat context: '{snapshot.topic}' at version {snapshot.version}")
+    
+    prompt, pruned = system_prompt(snapshot)
+    system = [
+        {
+            'type': 'text',
+            'text': prompt,
+            'cache_control': {'type': 'ephemeral'}
+        }
+    ]
+    if pruned:
+        system.append({'type': 'text', 'text': relevant_context(snapshot, message)})
+    
+    return {
+        'model': Config.CLAUDE_MODEL,
+        'max_tokens': 1000,
+        'system': system,
+        'messages': [
+            {
+                'role': 'user',
+                'content': message
+            }
+        ]
+    }
+
+def system_prompt(snapshot):
+    """System prompt for a graph snapshot, built once per topic and version,
+    and whether the graph in it was cut down to an outline."""
+    key = (snapshot.topic, snapshot.version)
+    with context_cache_lock:
+        if key in context_cache:
+            context_cache.move_to_end(key)
+            return context_cache[key]
+    
+    current_topic = snapshot.topic
+    # The full context lists every concept twice: by level and in a relationship.
+    pruned = 2 * estimate_tokens(snapshot.terms) > Config.CHAT_CONTEXT_TOKEN_BUDGET
+    if pruned:
+        context = graph_outline(snapshot)
+    else:
+        context = format_graph_context(prepare_d3_data(snapshot.graph, using_similarities=False))
+    prompt = f"""You are a friendly and knowledgeable AI assistant focused on {current_topic}. 
 Your primary knowledge comes from the knowledge graph below, but you can engage in natural conversation about related topics.
 
 Key Guidelines:
@@ -64,39 +102,126 @@ Key Guidelines:
 - You can engage in natural conversation while staying focused on {current_topic} topics
 - You can help users understand concepts by relating them to real-world examples
 
+Feel free to have a natural conversation about {current_topic} and related topics. If you're unsure about something, you can say so and focus on what you know from the knowledge graph.
+
 Here is the current structure of the knowledge graph:
 
 {context}
-
-Feel free to have a natural conversation about {current_topic} and related topics. If you're unsure about something, you can say so and focus on what you know from the knowledge graph.
 """
+    
+    with context_cache_lock:
+        same_topic = [cached for cached in context_cache if cached[0] == key[0] and cached != key]
+        if any(cached[1] > key[1] for cached in same_topic):
+            # A newer version was cached while this one was being built.
+            return prompt, pruned
+        for stale in same_topic:
+            del context_cache[stale]
+        context_cache[key] = (prompt, pruned)
+        while len(context_cache) > Config.CHAT_CONTEXT_CACHE_SIZE:
+            context_cache.popitem(last=False)
+    return prompt, pruned
+
+def estimate_tokens(texts):
+    # Roughly four characters per token, plus the list marker and newline.
+    return sum(len(text) // 4 + 2 for text in texts)
+
+def graph_outline(snapshot):
+    """The top CHAT_OUTLINE_LEVELS levels as an indented tree, each concept
+    with the size of its subtree, within CHAT_OUTLINE_TOKEN_BUDGET."""
+    graph = snapshot.graph
+    lines = [f"Outline of the top levels ({len(snapshot.terms)} concepts in total):"]
+    budget = Config.CHAT_OUTLINE_TOKEN_BUDGET
+    omitted = 0
+    stack = [(root, 0) for root in reversed(graph.roots())]
+    while stack:
+        concept_id, depth = stack.pop()
+        below = graph.subtree_size(concept_id) - 1
+        line = "  " * depth + f"- {concept_id}" + (f" ({below} concepts below)" if below else "")
+        if estimate_tokens([line]) > budget:
+            omitted += 1
+            continue
+        budget -= estimate_tokens([line])
+        lines.append(line)
+        if depth < Config.CHAT_OUTLINE_LEVELS:
+            stack.extend((child, depth + 1) for child in reversed(graph.children_of(concept_id)))
+    if omitted:
+        lines.append(f"({omitted} more concepts at these levels are not shown)")
+    return "\n".join(lines)
+
+def relevant_concepts(snapshot, message):
+    """Concepts in ``snapshot`` closest to ``message``, best first: nearest by
+    embedding, or, while the embedding model or the topic's vector index
+    isn't ready, named in it."""
+    if similarity_available():
+        try:
+            matches = vector_indexes.nearest(snapshot.graph, message, k=Config.CHAT_CONTEXT_SEEDS)
+            return [concept_id for concept_id, _ in matches]
+        except EmbeddingModelLoading:
+            pass
+        except Exception as e:
+            logger.error(f"Error retrieving chat context: {str(e)}")
+    
+    text = message.lower()
+    named = [term for term in snapshot.terms if len(term) > 2 and term.lower() in text]
+    return sorted(named, key=len, reverse=True)[:Config.CHAT_CONTEXT_SEEDS]
+
+def relevant_context(snapshot, message):
+    """The concepts most relevant to ``message`` with their ancestors, then
+    their siblings, rendered as a tree within CHAT_CONTEXT_TOKEN_BUDGET."""
+    graph = snapshot.graph
+    seeds = relevant_concepts(snapshot, message)
+    if not seeds:
+        return "No concepts in the knowledge graph closely match this message; use the outline above."
+    
+    selected = set()
+    budget = Config.CHAT_CONTEXT_TOKEN_BUDGET
+    
+    def include(concept_ids):
+        nonlocal budget
+        new = [concept_id for concept_id in concept_ids if concept_id not in selected]
+        cost = estimate_tokens(new)
+        if cost > budget:
+            return False
+        budget -= cost
+        selected.update(new)
+        return True
+    
+    for concept_id in seeds:
+        include(list(reversed(graph.ancestors(concept_id))) + [concept_id])
+    for concept_id in seeds:
+        parent = graph.parent_of(concept_id)
+        siblings = graph.children_of(parent) if parent is not None else []
+        for sibling in siblings[:Config.CHAT_CONTEXT_MAX_SIBLINGS]:
+            if not include([sibling]):
+                break
+    
+    lines = ["Parts of the knowledge graph most relevant to this message (indentation shows parent and child):"]
+    stack = [(root, 0) for root in reversed(graph.roots()) if root in selected]
+    while stack:
+        concept_id, depth = stack.pop()
+        lines.append("  " * depth + f"- {concept_id}")
+        stack.extend((child, depth + 1) for child in reversed(graph.children_of(concept_id)) if child in selected)
+    return "\n".join(lines)
+
+@chatui_bp.route('/chat/message', methods=['POST'])
+def message():
+    try:
+        message = request.json.get('message')
+        if not message:
+            logger.error("No message provided in request")
+            return jsonify({'status': 'error', 'message': 'No message provided'})
+
+        logger.info(f"Processing message: {message}")
+
+        try:
+            payload = chat_payload(message)
+        except ChatError as e:
+            return jsonify({'status': 'error', 'message': str(e)})
         
-        response = requests.post(
-            Config.CLAUDE_API_URL,
-            headers={
-                'x-api-key': Config.CLAUDE_API_KEY,
-                'anthropic-version': '2023-06-01',
-                'content-type': 'application/json'
-            },
-            json={
-                'model': 'claude-3-opus-20240229',
-                'max_tokens': 1000,
-                'system': system_message,
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': message
-                    }
-                ]
-            }
-        )
+        response_data = llm_client.create_message(payload, name='chat')
         
-        logger.info(f"Claude API response status: {response.status_code}")
-        response_data = response.json()
         logger.info(f"Claude API response: {response_data}")
         
-        response.raise_for_status()
-        
         if 'content' not in response_data or not response_data['content']:
             logger.error("No content in Claude API response")
             return jsonify({'status': 'error', 'message': 'No response from AI'})
@@ -126,6 +251,69 @@ Feel free to have a natural conversation about {current_topic} and related topic
             'message': f'An unexpected error occurred: {str(e)}'
         })
 
+@chatui_bp.route('/chat/stream', methods=['POST'])
+def stream():
+    """/chat/message as server-sent events: ``delta`` events with text as it
+    is generated, then ``done`` with token usage and timing, or ``error``.
+    If the browser goes away the upstream request is closed, which stops
+    generation."""
+    message = (request.json or {}).get('message')
+    if not message:
+        return jsonify({'status': 'error', 'message': 'No message provided'}), 400
+    
+    logger.info(f"Streaming reply to: {message}")
+    
+    def events():
+        started = time.perf_counter()
+        first_token = None
+        usage = {}
+        stop_reason = None
+        chunks = None
+        try:
+            payload = chat_payload(message)
+            chunks = llm_client.stream_message(payload, name='chat')
+            for chunk in chunks:
+                kind = chunk.get('type')
+                if kind == 'content_block_delta' and chunk['delta'].get('type') == 'text_delta':
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    yield sse_event('delta', {'text': chunk['delta']['text']})
+                elif kind == 'message_start':
+                    usage.update(chunk['message'].get('usage', {}))
+                elif kind == 'message_delta':
+                    usage.update(chunk.get('usage', {}))
+                    stop_reason = chunk['delta'].get('stop_reason')
+                elif kind == 'error':
+                    raise ChatError(chunk['error'].get('message', 'Error from AI service'))
+        except ChatError as e:
+            yield sse_event('error', {'message': str(e)})
+            return
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error calling Claude API: {str(e)}")
+            yield sse_event('error', {'message': f'Error communicating with AI service: {str(e)}'})
+            return
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            yield sse_event('error', {'message': f'An unexpected error occurred: {str(e)}'})
+            return
+        finally:
+            if chunks is not None:
+                chunks.close()
+        
+        finished = time.perf_counter()
+        logger.info(f"Streamed reply: {usage.get('output_tokens')} tokens in {finished - started:.2f}s")
+        yield sse_event('done', {
+            'usage': usage,
+            'stop_reason': stop_reason,
+            'timing': {
+                'first_token_ms': round((first_token - started) * 1000) if first_token else None,
+                'total_ms': round((finished - started) * 1000)
+            }
+        })
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 def format_graph_context(graph_data):
     """Format graph data into a context message for the AI."""
     nodes = graph_data['nodes']
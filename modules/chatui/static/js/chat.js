@@ -138,6 +138,8 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    let activeReply = null;
+
     async function sendMessage() {
         const message = messageInput.value.trim();
         if (!message) return;
@@ -146,48 +148,83 @@ document.addEventListener('DOMContentLoaded', function() {
 
         addMessage('user', message);
 
+        // A new question cancels the reply still streaming in; the server
+        // then closes its request to Claude.
+        if (activeReply) activeReply.abort();
+        const controller = new AbortController();
+        activeReply = controller;
+
         const thinkingDiv = addThinkingMessage();
+        let messageText = null;
 
         try {
-            const response = await fetch('/chat/message', {
+            const response = await fetch('/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({ message })
+                body: JSON.stringify({ message }),
+                signal: controller.signal
             });
 
-            const data = await response.json();
-            console.log('Server response:', data); 
-
-            removeThinkingMessage(thinkingDiv);
-
-            if (data.status === 'error') {
-                console.error('Server returned error:', data.message);
-                addMessage('assistant', 'Sorry, there was an error processing your message. Please try again.');
-                return;
+            if (!response.ok || !response.body) {
+                throw new Error(`Server returned ${response.status}`);
             }
 
-            if (!data.response) {
-                console.error('No response content in server response');
-                addMessage('assistant', 'Sorry, I received an empty response. Please try again.');
-                return;
-            }
-
-            setTimeout(async () => {
-                const messageDiv = addMessage('assistant', '', true);
-                const messageText = messageDiv.querySelector('.message-text');
-                try {
-                    await typeMessage(messageText, data.response);
-                } catch (error) {
-                    console.error('Error during typing animation:', error);
-                    messageText.textContent = data.response; 
+            await readEvents(response.body, (event, data) => {
+                if (event === 'delta') {
+                    if (!messageText) {
+                        removeThinkingMessage(thinkingDiv);
+                        messageText = addMessage('assistant', '', true).querySelector('.message-text');
+                        messageText.classList.add('typing');
+                    }
+                    messageText.textContent += data.text;
+                    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                } else if (event === 'done') {
+                    console.log('Reply usage:', data.usage, 'timing:', data.timing);
+                    if (!messageText) {
+                        removeThinkingMessage(thinkingDiv);
+                        addMessage('assistant', 'Sorry, I received an empty response. Please try again.');
+                    }
+                } else if (event === 'error') {
+                    throw new Error(data.message);
                 }
-            }, 500);
+            });
         } catch (error) {
+            if (error.name === 'AbortError') return;
             console.error('Error sending message:', error);
             removeThinkingMessage(thinkingDiv);
-            addMessage('assistant', 'Sorry, there was an error processing your message. Please try again.');
+            if (!messageText) {
+                addMessage('assistant', 'Sorry, there was an error processing your message. Please try again.');
+            }
+        } finally {
+            removeThinkingMessage(thinkingDiv);
+            if (messageText) messageText.classList.remove('typing');
+            if (activeReply === controller) activeReply = null;
+        }
+    }
+
+    async function readEvents(body, onEvent) {
+        // Minimal server-sent events parser: frames end with a blank line.
+        const reader = body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let end;
+            while ((end = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, end);
+                buffer = buffer.slice(end + 2);
+                let event = 'message';
+                let data = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                onEvent(event, data ? JSON.parse(data) : {});
+            }
         }
     }
 
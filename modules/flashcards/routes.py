@@ -1,13 +1,14 @@
 from flask import render_template, request, jsonify
-import json
-import os
 import logging
-from config import Config
 from . import flashcards_bp
 from .utils import get_term_definition
+from modules.graph.snapshot import graph_snapshots
 
 logger = logging.getLogger(__name__)
 
+def current_snapshot():
+    return graph_snapshots.get(request.args.get('topic'))
+
 @flashcards_bp.route('/')
 def index():
     return render_template('flashcards.html')
@@ -15,23 +16,17 @@ def index():
 @flashcards_bp.route('/terms')
 def get_terms():
     try:
-        data_file = Config.GRAPH_DATA_FILE
+        snapshot = current_snapshot()
         
-        if not os.path.exists(data_file):
-            logger.error(f"Data file not found: {data_file}")
+        if snapshot is None:
+            logger.error("No graph found in the store")
             return jsonify({'status': 'error', 'message': 'Data file not found'})
         
-        with open(data_file, 'r') as f:
-            data = json.load(f)
-            
-        terms = [concept['id'] for concept in data['concepts']]
+        terms = snapshot.terms
         
         logger.debug(f"Retrieved {len(terms)} terms from the knowledge graph")
         
         return jsonify({'status': 'success', 'terms': terms})
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parsing error: {str(e)}")
-        return jsonify({'status': 'error', 'message': 'Invalid JSON in data file'})
     except Exception as e:
         logger.error(f"Error retrieving terms: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)})
@@ -64,11 +59,8 @@ def get_definition():
 @flashcards_bp.route('/filter-by-level/<int:level>')
 def filter_by_level(level):
     try:
-        data_file = Config.GRAPH_DATA_FILE
-        
-        with open(data_file, 'r') as f:
-            data = json.load(f)
-        terms = [concept['id'] for concept in data['concepts'] if concept.get('level') == level]
+        snapshot = current_snapshot()
+        terms = snapshot.terms_at_level(level) if snapshot else []
         
         logger.debug(f"Retrieved {len(terms)} terms at level {level}")
         
@@ -79,15 +71,17 @@ def filter_by_level(level):
 
 @flashcards_bp.route('/filter-by-parent/<parent>')
 def filter_by_parent(parent):
+    recursive = request.args.get('recursive', 'false').lower() == 'true'
     try:
-        data_file = Config.GRAPH_DATA_FILE
-        
-        with open(data_file, 'r') as f:
-            data = json.load(f)
-            
-        terms = [concept['id'] for concept in data['concepts'] if concept.get('parent') == parent]
+        snapshot = current_snapshot()
+        if snapshot is None:
+            terms = []
+        elif recursive:
+            terms = snapshot.descendants_of(parent)
+        else:
+            terms = snapshot.children_of(parent)
         
-        logger.debug(f"Retrieved {len(terms)} terms with parent '{parent}'")
+        logger.debug(f"Retrieved {len(terms)} terms under parent '{parent}' (recursive={recursive})")
         
         return jsonify({'status': 'success', 'terms': terms})
     except Exception as e:
@@ -97,14 +91,8 @@ def filter_by_parent(parent):
 @flashcards_bp.route('/categories')
 def get_categories():
     try:
-        data_file = Config.GRAPH_DATA_FILE
-        
-        with open(data_file, 'r') as f:
-            data = json.load(f)
-            
-        parent_ids = set(concept.get('parent') for concept in data['concepts'] if concept.get('parent'))
-        
-        categories = [concept['id'] for concept in data['concepts'] if concept['id'] in parent_ids]
+        snapshot = current_snapshot()
+        categories = snapshot.categories if snapshot else []
         
         logger.debug(f"Retrieved {len(categories)} category terms")
         
@@ -4,6 +4,8 @@ import requests
 import logging
 from config import Config
 from .cache import definition_cache
+from modules.graph.snapshot import graph_snapshots
+from modules.graph.llm_client import llm_client
 
 logger = logging.getLogger(__name__)
 
@@ -51,45 +53,16 @@ def get_term_definition(term):
         prompt = f"""Define the term {term} in a clear, concise way that would be suitable for a flashcard. The definition should be 1-3 sentences long and focus on the essential characteristics. Context: This term is related to {context}"""
         
         payload = {
-            "model": "claude-3-haiku-20240307",
+            "model": Config.CLAUDE_MODEL,
             "max_tokens": 150,
             "messages": [
                 {"role": "user", "content": prompt}
             ]
         }
         
-        logger.debug(f"Claude API Request URL: {Config.CLAUDE_API_URL}")
-        logger.debug(f"Claude API Request Headers: x-api-key: [REDACTED], anthropic-version: 2023-06-01")
         logger.debug(f"Claude API Request Payload: {json.dumps(payload, indent=2)}")
         
-        response = requests.post(
-            Config.CLAUDE_API_URL,
-            headers={
-                "x-api-key": Config.CLAUDE_API_KEY,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json"
-            },
-            json={
-                "model": "claude-3-opus-20240229",  
-                "max_tokens": 150,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ]
-            },
-            timeout=10
-        )
-        
-        logger.debug(f"Claude API Response Status: {response.status_code}")
-        logger.debug(f"Claude API Response Content: {response.text[:200]}...") 
-        
-        response.raise_for_status()
-        
-        try:
-            response_data = response.json()
-            logger.debug(f"Successfully parsed JSON response")
-        except json.JSONDecodeError:
-            logger.error(f"Failed to parse JSON response: {response.text}")
-            raise
+        response_data = llm_client.create_message(payload, timeout=10, name="flashcards")
         
         content = response_data.get("content", [])
         definition = ""
@@ -127,22 +100,18 @@ def get_term_definition(term):
 
 def get_term_context(term):
     try:
-        data_file = Config.GRAPH_DATA_FILE
-        
-        with open(data_file, 'r') as f:
-            data = json.load(f)
+        snapshot = graph_snapshots.get()
         
-        term_data = next((concept for concept in data['concepts'] if concept['id'].lower() == term.lower()), None)
+        term_data = snapshot.find(term) if snapshot else None
         
         if term_data:
             parent_id = term_data.get('parent')
             
             if parent_id:
-                siblings = [concept['id'] for concept in data['concepts'] 
-                            if concept.get('parent') == parent_id and concept['id'] != term]
+                siblings = [sibling for sibling in snapshot.children_of(parent_id)
+                            if sibling != term]
                 
-                children = [concept['id'] for concept in data['concepts'] 
-                            if concept.get('parent') == term]
+                children = snapshot.children_of(term)
                 
                 context = f"the broader category of '{parent_id}'"
                 
@@ -160,8 +129,7 @@ def get_term_context(term):
                 
                 return context
             else:
-                children = [concept['id'] for concept in data['concepts'] 
-                            if concept.get('parent') == term]
+                children = snapshot.children_of(term)
                 
                 if children:
                     child_str = ", ".join([f"'{c}'" for c in children[:3]])
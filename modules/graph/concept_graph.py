@@ -0,0 +1,638 @@
+import logging
+import math
+from array import array
+from collections import deque
+from itertools import compress, islice
+
+logger = logging.getLogger(__name__)
+
+NO_PARENT = -1
+NO_LEVEL = -2 ** 31
+
+
+def relationship_key(parent_id, child_id):
+    return f"{parent_id}->{child_id}"
+
+
+def split_relationship_key(key):
+    source, _, target = key.partition("->")
+    return source, target
+
+
+def relationship_triples(relationships):
+    """(source, target, value) for relationships given as ``{"source",
+    "target", "value"}`` objects, as triples, or, as in files written before
+    they had explicit fields, as a ``{"source->target": value}`` dict (which
+    is ambiguous for names containing "->")."""
+    if isinstance(relationships, dict):
+        return [(*split_relationship_key(key), value) for key, value in relationships.items()]
+    return [(r["source"], r["target"], r.get("value")) if isinstance(r, dict) else tuple(r)
+            for r in relationships]
+
+
+class ConceptGraph:
+    """In-memory concept hierarchy over interned integer ids.
+
+    Concept names are interned to slots; parent and level live in typed
+    arrays indexed by slot, and the similarity of each tree edge is stored
+    in a float array indexed by the child's slot, so renaming a concept only
+    rewrites its name. Relationships that are not tree edges are kept in a
+    small side table keyed by (source, target). Each slot also keeps the
+    size of the subtree below it, updated along the parent chain on every
+    link and unlink, so subtree sizes are O(1) and ancestor chains and
+    descendant lists cost only the length of the answer. Top-level slots
+    are tracked the same way, so walking down from the roots (``roots``,
+    ``children_page``) never touches the rest of the graph. Concept and
+    relationship dicts are only built at the boundary (``get``,
+    ``concepts``, ``to_dict``), so ``to_dict`` still round-trips the JSON
+    file shape.
+
+    Every mutation is also recorded as a compact op in ``changes`` so it can
+    be journaled and replayed with ``apply``. Once a store commits those ops
+    it stamps the graph with its new ``version`` and keeps the ops in a
+    bounded ``history`` so clients can be sent only what changed.
+    """
+
+    __slots__ = ("core", "changes", "version", "history", "_names", "_index", "_alive",
+                 "_parent", "_level", "_similarity", "_size", "_children", "_roots", "_extra",
+                 "_relationships", "_edges_by_node", "_live")
+
+    def __init__(self, core, concepts=None, relationships=None, history_size=256):
+        self.core = core
+        self.changes = []
+        self.version = 0
+        self.history = deque(maxlen=history_size)
+
+        self._names = []
+        self._index = {}
+        self._alive = bytearray()
+        self._parent = array('i')
+        self._level = array('i')
+        self._similarity = array('d')
+        self._size = array('i')
+        self._children = {}
+        self._roots = {}
+        self._extra = {}
+        self._relationships = {}
+        self._edges_by_node = {}
+        self._live = 0
+
+        for concept in concepts or []:
+            concept = dict(concept)
+            concept_id = concept.pop("id")
+            if concept_id in self:
+                logger.warning(f"Duplicate concept '{concept_id}' ignored")
+                continue
+            parent, level = concept.pop("parent", None), concept.pop("level", None)
+            try:
+                self._insert(concept_id, parent, level, concept)
+            except ValueError as e:
+                logger.warning(f"{e}; loading '{concept_id}' as a root")
+                self._insert(concept_id, None, level, concept)
+
+        if relationships:
+            edge_slots = {
+                (self._names[self._parent[i]], self._names[i]): i
+                for i in compress(range(len(self._names)), self._alive) if self._parent[i] != NO_PARENT
+            }
+            for source, target, value in relationship_triples(relationships):
+                slot = edge_slots.get((source, target))
+                if slot is not None and value is not None:
+                    self._similarity[slot] = value
+                else:
+                    self._set_side_relationship(source, target, value)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("core"), data.get("concepts", []), data.get("relationships", []))
+
+    def to_dict(self):
+        return {
+            "core": self.core,
+            "concepts": list(self.concepts),
+            "relationships": self.relationships
+        }
+
+    def copy(self):
+        """Independent copy, committed history included, so ``changes_since``
+        still works on it."""
+        clone = ConceptGraph.__new__(ConceptGraph)
+        clone.core = self.core
+        clone.changes = list(self.changes)
+        clone.version = self.version
+        clone.history = deque(self.history, maxlen=self.history.maxlen)
+        clone._names = list(self._names)
+        clone._index = dict(self._index)
+        clone._alive = bytearray(self._alive)
+        clone._parent = array('i', self._parent)
+        clone._level = array('i', self._level)
+        clone._similarity = array('d', self._similarity)
+        clone._size = array('i', self._size)
+        clone._children = {parent: dict(kids) for parent, kids in self._children.items()}
+        clone._roots = dict(self._roots)
+        clone._extra = {slot: dict(extra) for slot, extra in self._extra.items()}
+        clone._relationships = dict(self._relationships)
+        clone._edges_by_node = {node: set(edges) for node, edges in self._edges_by_node.items()}
+        clone._live = self._live
+        return clone
+
+    def __contains__(self, concept_id):
+        return self._slot(concept_id) is not None
+
+    def __len__(self):
+        return self._live
+
+    def ids(self):
+        return compress(self._names, self._alive)
+
+    @property
+    def concepts(self):
+        return (self._concept(i) for i in compress(range(len(self._names)), self._alive))
+
+    @property
+    def children(self):
+        return {self._names[p]: [self._names[c] for c in kids] for p, kids in self._children.items()}
+
+    @property
+    def relationships(self):
+        return [{"source": source, "target": target, "value": value}
+                for source, target, value in self.relationship_items()]
+
+    def rows(self):
+        """Yield (id, level, parent, similarity) for every concept in one pass over the arrays."""
+        names, parents, levels, similarities = self._names, self._parent, self._level, self._similarity
+        for i in compress(range(len(names)), self._alive):
+            parent, level, similarity = parents[i], levels[i], similarities[i]
+            yield (names[i],
+                   self._odd_level(i) if level == NO_LEVEL else level,
+                   None if parent == NO_PARENT else names[parent],
+                   None if math.isnan(similarity) else similarity)
+
+    def relationship_items(self):
+        for concept_id, _, parent_id, similarity in self.rows():
+            if similarity is not None:
+                yield parent_id, concept_id, similarity
+        for (source, target), value in self._relationships.items():
+            yield source, target, value
+
+    def row(self, concept_id):
+        """The rows() tuple for a single concept."""
+        slot = self._slot_or_raise(concept_id)
+        parent, level, similarity = self._parent[slot], self._level[slot], self._similarity[slot]
+        return (concept_id,
+                self._odd_level(slot) if level == NO_LEVEL else level,
+                None if parent == NO_PARENT else self._names[parent],
+                None if math.isnan(similarity) else similarity)
+
+    def get(self, concept_id):
+        slot = self._slot(concept_id)
+        return self._concept(slot) if slot is not None else None
+
+    def parent_of(self, concept_id):
+        parent = self._parent[self._slot_or_raise(concept_id)]
+        return None if parent == NO_PARENT else self._names[parent]
+
+    def level_of(self, concept_id):
+        slot = self._slot_or_raise(concept_id)
+        level = self._level[slot]
+        return self._odd_level(slot) if level == NO_LEVEL else level
+
+    def children_of(self, concept_id):
+        slot = self._index.get(concept_id)
+        return [self._names[c] for c in self._children.get(slot, ())]
+
+    def has_children(self, concept_id):
+        return self._index.get(concept_id) in self._children
+
+    def position(self, concept_id):
+        """Stored layout coordinates (x, y), or None."""
+        extra = self._extra.get(self._slot(concept_id))
+        return (extra["x"], extra["y"]) if extra and "x" in extra else None
+
+    def child_count(self, concept_id):
+        return len(self._children.get(self._index.get(concept_id), ()))
+
+    def children_page(self, concept_id, cursor=None, limit=None):
+        """Up to ``limit`` children after the child named ``cursor``.
+
+        Returns (ids, remaining). Raises KeyError if ``cursor`` is not a
+        child of ``concept_id`` (e.g. it was renamed or removed meanwhile).
+        """
+        kids = self._children.get(self._index.get(concept_id), {})
+        start = 0
+        if cursor is not None:
+            after = self._index.get(cursor)
+            if after not in kids:
+                raise KeyError(cursor)
+            start = next(i for i, child in enumerate(kids) if child == after) + 1
+        stop = None if limit is None else start + limit
+        page = [self._names[child] for child in islice(kids, start, stop)]
+        return page, len(kids) - start - len(page)
+
+    def roots(self):
+        """Top-level concepts: no parent, or a parent that is not a concept."""
+        found = []
+        for slot in self._roots:
+            if self._alive[slot]:
+                found.append(self._names[slot])
+            else:
+                found.extend(self._names[child] for child in self._children.get(slot, ()))
+        return found
+
+    def descendants(self, concept_id):
+        """Every concept below ``concept_id``, in depth-first pre-order."""
+        found = []
+        stack = list(reversed(self._children.get(self._index.get(concept_id), ())))
+        while stack:
+            child = stack.pop()
+            found.append(self._names[child])
+            kids = self._children.get(child)
+            if kids:
+                stack.extend(reversed(kids))
+        return found
+
+    def ancestors(self, concept_id):
+        """Parent chain of ``concept_id``, nearest first, ending at its root."""
+        slot = self._index.get(concept_id)
+        return [self._names[a] for a in self._ancestor_slots(slot)] if slot is not None else []
+
+    def subtree_size(self, concept_id):
+        """Number of concepts in the subtree rooted at ``concept_id``, itself included."""
+        slot = self._index.get(concept_id)
+        return self._size[slot] if slot is not None else 0
+
+    def similarity(self, parent_id, child_id):
+        slot = self._tree_edge(parent_id, child_id)
+        if slot is not None and not math.isnan(self._similarity[slot]):
+            return self._similarity[slot]
+        return self._relationships.get((parent_id, child_id))
+
+    def take_changes(self):
+        changes, self.changes = self.changes, []
+        return changes
+
+    def mark_committed(self, version, ops):
+        if ops:
+            self.history.append((version, ops))
+        self.version = version
+
+    def reset_history(self, version):
+        self.history.clear()
+        self.version = version
+
+    def changes_since(self, version):
+        """Fold committed ops newer than ``version`` into id-level changes.
+
+        Returns None when the history no longer reaches back to ``version``.
+        ``renamed`` pairs are (id the client knows, current id); ``removed``
+        uses the ids the client knows.
+        """
+        if version > self.version:
+            return None
+        entries = [(v, ops) for v, ops in self.history if v > version]
+        if version < self.version and (not entries or entries[0][0] != version + 1
+                                       or len(entries) != self.version - version):
+            return None
+
+        added, removed, touched, renames = {}, set(), {}, {}
+        for _, ops in entries:
+            for op in ops:
+                kind = op["op"]
+                if kind == "add":
+                    concept_id = op["concept"]["id"]
+                    if concept_id in removed:
+                        removed.discard(concept_id)
+                        touched[concept_id] = None
+                    else:
+                        added[concept_id] = None
+                elif kind == "remove":
+                    for concept_id in op["ids"]:
+                        touched.pop(concept_id, None)
+                        if concept_id in added:
+                            del added[concept_id]
+                        else:
+                            removed.add(renames.pop(concept_id, concept_id))
+                elif kind == "rename":
+                    old_id, new_id = op["old"], op["new"]
+                    if old_id in added:
+                        del added[old_id]
+                        added[new_id] = None
+                    else:
+                        renames[new_id] = renames.pop(old_id, old_id)
+                    if old_id in touched:
+                        del touched[old_id]
+                        touched[new_id] = None
+                elif kind == "set_parent":
+                    touched[op["id"]] = None
+                elif kind in ("set_rel", "drop_rel"):
+                    touched[op["target"]] = None
+
+        return {
+            "added": [c for c in added if c in self],
+            "updated": [c for c in touched if c in self and c not in added],
+            "removed": sorted(removed),
+            "renamed": [[old_id, new_id] for new_id, old_id in renames.items() if old_id != new_id]
+        }
+
+    def apply(self, op):
+        kind = op["op"]
+        if kind == "add":
+            concept = dict(op["concept"])
+            self.add(concept.pop("id"), concept.pop("parent", None), concept.pop("level", 0), **concept)
+        elif kind == "remove":
+            self.remove(op["ids"])
+        elif kind == "rename":
+            self.rename(op["old"], op["new"])
+        elif kind == "set_parent":
+            self.set_parent(op["id"], op["parent"], op.get("level"))
+        elif kind == "set_rel":
+            # Journals written before ops carried source/target use "key".
+            source, target = (op["source"], op["target"]) if "key" not in op else split_relationship_key(op["key"])
+            self.set_similarity(source, target, op["value"])
+        elif kind == "drop_rel":
+            source, target = (op["source"], op["target"]) if "key" not in op else split_relationship_key(op["key"])
+            self.drop_similarity(source, target)
+        elif kind == "set_positions":
+            self.set_positions(op["positions"])
+        else:
+            raise ValueError(f"Unknown graph op '{kind}'")
+
+    def add(self, concept_id, parent=None, level=0, **extra):
+        slot = self._insert(concept_id, parent, level, extra)
+        concept = self._concept(slot)
+        self.changes.append({"op": "add", "concept": dict(concept)})
+        return concept
+
+    def set_parent(self, concept_id, parent_id, level=None):
+        slot = self._slot_or_raise(concept_id)
+        self._check_acyclic(slot, parent_id)
+        self.changes.append({"op": "set_parent", "id": concept_id, "parent": parent_id, "level": level})
+
+        old_parent = self._parent[slot]
+        similarity = self._similarity[slot]
+        if old_parent != NO_PARENT and not math.isnan(similarity):
+            self._set_side_relationship(self._names[old_parent], concept_id, similarity)
+        self._unlink(slot)
+        self._link(slot, parent_id)
+        if level is not None:
+            self._set_level(slot, level)
+
+    def set_positions(self, positions):
+        """Store layout coordinates, ``{id: (x, y)}``, with the concepts' extra keys."""
+        stored = {}
+        for concept_id, (x, y) in positions.items():
+            slot = self._slot(concept_id)
+            if slot is None:
+                continue
+            extra = self._extra.setdefault(slot, {})
+            extra["x"], extra["y"] = round(float(x), 1), round(float(y), 1)
+            stored[concept_id] = [extra["x"], extra["y"]]
+        if stored:
+            self.changes.append({"op": "set_positions", "positions": stored})
+
+    def remove(self, concept_ids):
+        concept_ids = set(concept_ids)
+        self.changes.append({"op": "remove", "ids": sorted(concept_ids)})
+        for concept_id in concept_ids:
+            slot = self._slot(concept_id)
+            if slot is None:
+                continue
+            self._unlink(slot)
+            self._alive[slot] = 0
+            self._size[slot] -= 1
+            self._live -= 1
+            self._extra.pop(slot, None)
+            # Children left behind keep pointing at the name, as in the JSON file;
+            # the slot stays interned for them until they move or it is re-added.
+            kids = self._children.get(slot)
+            if kids:
+                for child in kids:
+                    self._similarity[child] = math.nan
+            else:
+                del self._index[concept_id]
+                self._roots.pop(slot, None)
+            for source, target in list(self._edges_by_node.get(concept_id, ())):
+                self._drop_side_relationship(source, target)
+
+        if len(self._names) > 2 * self._live + 1024:
+            self._compact()
+
+    def rename(self, old_id, new_id):
+        slot = self._slot_or_raise(old_id)
+        if new_id in self:
+            raise ValueError(f"Concept '{new_id}' already exists")
+
+        placeholder = self._index.get(new_id)
+        if placeholder is not None:
+            chain = {slot, *self._ancestor_slots(slot)}
+            if any(child in chain for child in self._children.get(placeholder, ())):
+                raise ValueError(f"Renaming '{old_id}' to '{new_id}' would create a cycle")
+        self.changes.append({"op": "rename", "old": old_id, "new": new_id})
+
+        if placeholder is not None:
+            self._adopt_children(placeholder, slot)
+        del self._index[old_id]
+        self._names[slot] = new_id
+        self._index[new_id] = slot
+
+        for source, target in list(self._edges_by_node.get(old_id, ())):
+            value = self._drop_side_relationship(source, target)
+            self._set_side_relationship(new_id if source == old_id else source,
+                                        new_id if target == old_id else target, value)
+
+    def set_similarity(self, parent_id, child_id, value):
+        slot = self._tree_edge(parent_id, child_id)
+        if slot is not None and value is not None:
+            self._similarity[slot] = value
+        else:
+            self._set_side_relationship(parent_id, child_id, value)
+        self.changes.append({"op": "set_rel", "source": parent_id, "target": child_id, "value": value})
+
+    def drop_similarity(self, parent_id, child_id):
+        slot = self._tree_edge(parent_id, child_id)
+        if slot is not None and not math.isnan(self._similarity[slot]):
+            value = self._similarity[slot]
+            self._similarity[slot] = math.nan
+        elif (parent_id, child_id) in self._relationships:
+            value = self._drop_side_relationship(parent_id, child_id)
+        else:
+            return None
+        self.changes.append({"op": "drop_rel", "source": parent_id, "target": child_id})
+        return value
+
+    def _slot(self, concept_id):
+        slot = self._index.get(concept_id)
+        return slot if slot is not None and self._alive[slot] else None
+
+    def _slot_or_raise(self, concept_id):
+        slot = self._slot(concept_id)
+        if slot is None:
+            raise KeyError(concept_id)
+        return slot
+
+    def _intern(self, name):
+        slot = self._index.get(name)
+        if slot is None:
+            slot = self._allocate(name)
+        return slot
+
+    def _allocate(self, name):
+        slot = len(self._names)
+        self._names.append(name)
+        self._index[name] = slot
+        self._alive.append(0)
+        self._parent.append(NO_PARENT)
+        self._level.append(NO_LEVEL)
+        self._similarity.append(math.nan)
+        self._size.append(0)
+        self._roots[slot] = None
+        return slot
+
+    def _insert(self, concept_id, parent, level, extra):
+        slot = self._slot(concept_id)
+        if slot is not None:
+            self._check_acyclic(slot, parent)
+            self._unlink(slot)
+        else:
+            if parent is not None and parent == concept_id:
+                raise ValueError(f"'{concept_id}' cannot be its own parent")
+            placeholder = self._index.get(concept_id)
+            if placeholder is not None:
+                self._check_acyclic(placeholder, parent)
+            slot = self._allocate(concept_id)
+            self._size[slot] = 1
+            if placeholder is not None:
+                self._adopt_children(placeholder, slot)
+            self._alive[slot] = 1
+            self._live += 1
+
+        self._extra.pop(slot, None)
+        if extra:
+            self._extra[slot] = dict(extra)
+        self._set_level(slot, level)
+        self._link(slot, parent)
+        return slot
+
+    def _set_level(self, slot, level):
+        # Anything that is not a plain int (e.g. "2" from an LLM) is kept
+        # verbatim with the extra keys so it still round-trips.
+        extra = self._extra.get(slot)
+        if extra is not None:
+            extra.pop("level", None)
+        if level is None or (type(level) is int and level != NO_LEVEL):
+            self._level[slot] = NO_LEVEL if level is None else level
+        else:
+            self._level[slot] = NO_LEVEL
+            self._extra.setdefault(slot, {})["level"] = level
+
+    def _odd_level(self, slot):
+        extra = self._extra.get(slot)
+        return extra.get("level") if extra else None
+
+    def _concept(self, slot):
+        level = self._level[slot]
+        parent = self._parent[slot]
+        concept = {
+            "id": self._names[slot],
+            "level": None if level == NO_LEVEL else level,
+            "parent": None if parent == NO_PARENT else self._names[parent]
+        }
+        extra = self._extra.get(slot)
+        if extra:
+            concept.update(extra)
+        return concept
+
+    def _tree_edge(self, parent_id, child_id):
+        slot = self._slot(child_id)
+        if slot is None or self._parent[slot] == NO_PARENT:
+            return None
+        return slot if self._parent[slot] == self._index.get(parent_id) else None
+
+    def _link(self, slot, parent_id):
+        self._similarity[slot] = math.nan
+        if parent_id is None:
+            self._parent[slot] = NO_PARENT
+            return
+        parent = self._intern(parent_id)
+        self._roots.pop(slot, None)
+        self._parent[slot] = parent
+        self._children.setdefault(parent, {})[slot] = None
+        self._add_to_ancestors(slot, self._size[slot])
+        if self._relationships.get((parent_id, self._names[slot])) is not None:
+            self._similarity[slot] = self._drop_side_relationship(parent_id, self._names[slot])
+
+    def _unlink(self, slot):
+        parent = self._parent[slot]
+        if parent == NO_PARENT:
+            return
+        self._add_to_ancestors(slot, -self._size[slot])
+        siblings = self._children.get(parent)
+        if siblings is not None:
+            siblings.pop(slot, None)
+            if not siblings:
+                del self._children[parent]
+                name = self._names[parent]
+                if not self._alive[parent] and self._index.get(name) == parent:
+                    del self._index[name]
+                    self._roots.pop(parent, None)
+        self._parent[slot] = NO_PARENT
+        self._roots[slot] = None
+
+    def _adopt_children(self, old_slot, new_slot):
+        self._roots.pop(old_slot, None)
+        kids = self._children.pop(old_slot, None)
+        if not kids:
+            return
+        for child in kids:
+            self._parent[child] = new_slot
+        self._children.setdefault(new_slot, {}).update(kids)
+        moved, self._size[old_slot] = self._size[old_slot], 0
+        self._size[new_slot] += moved
+        self._add_to_ancestors(new_slot, moved)
+
+    def _ancestor_slots(self, slot):
+        parent = self._parent[slot]
+        while parent != NO_PARENT:
+            yield parent
+            parent = self._parent[parent]
+
+    def _add_to_ancestors(self, slot, delta):
+        for ancestor in self._ancestor_slots(slot):
+            self._size[ancestor] += delta
+
+    def _check_acyclic(self, slot, parent_id):
+        parent = self._index.get(parent_id)
+        if parent is not None and (parent == slot or slot in self._ancestor_slots(parent)):
+            raise ValueError(f"Moving '{self._names[slot]}' under '{parent_id}' would create a cycle")
+
+    def _set_side_relationship(self, source, target, value):
+        self._relationships[(source, target)] = value
+        self._edges_by_node.setdefault(source, set()).add((source, target))
+        self._edges_by_node.setdefault(target, set()).add((source, target))
+
+    def _drop_side_relationship(self, source, target):
+        value = self._relationships.pop((source, target), None)
+        for endpoint in (source, target):
+            edges = self._edges_by_node.get(endpoint)
+            if edges is not None:
+                edges.discard((source, target))
+                if not edges:
+                    del self._edges_by_node[endpoint]
+        return value
+
+    def _compact(self):
+        keep = [i for i, name in enumerate(self._names) if self._alive[i] or self._index.get(name) == i]
+        remap = {old: new for new, old in enumerate(keep)}
+
+        self._names = [self._names[i] for i in keep]
+        self._index = {name: i for i, name in enumerate(self._names)}
+        self._alive = bytearray(self._alive[i] for i in keep)
+        self._parent = array('i', (NO_PARENT if self._parent[i] == NO_PARENT else remap[self._parent[i]]
+                                   for i in keep))
+        self._level = array('i', (self._level[i] for i in keep))
+        self._similarity = array('d', (self._similarity[i] for i in keep))
+        self._size = array('i', (self._size[i] for i in keep))
+        self._children = {remap[p]: {remap[c]: None for c in kids} for p, kids in self._children.items()}
+        self._roots = {remap[slot]: None for slot in self._roots}
+        self._extra = {remap[i]: extra for i, extra in self._extra.items()}
+        logger.debug(f"Compacted concept graph '{self.core}' to {len(keep)} slots")
@@ -0,0 +1,167 @@
+import hashlib
+import re
+import time
+import numpy as np
+from config import Config
+
+
+class EmbeddingBackend:
+    """Turns texts into vectors. Subclasses implement ``_load`` and ``_encode``.
+
+    Every backend keeps the numbers used to compare them: vector dimension,
+    resident size of the model weights, load time and encode throughput.
+    """
+
+    name = None
+
+    def __init__(self, model_name=None):
+        self.model_name = model_name or Config.EMBEDDING_MODEL
+        self.dimension = None
+        self.memory_bytes = None
+        self.load_seconds = None
+        self.encoded = 0
+        self.encode_seconds = 0.0
+
+    @classmethod
+    def identity(cls, model_name):
+        # Vectors from backends with different identities are never mixed in the cache.
+        return model_name
+
+    def load(self):
+        started = time.perf_counter()
+        self._load()
+        self.load_seconds = time.perf_counter() - started
+        return self
+
+    def encode(self, texts, prompt_name=None):
+        started = time.perf_counter()
+        vectors = np.asarray(self._encode(list(texts), prompt_name), dtype=np.float32)
+        self.encode_seconds += time.perf_counter() - started
+        self.encoded += len(texts)
+        return vectors
+
+    def info(self):
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "dimension": self.dimension,
+            "memory_bytes": self.memory_bytes,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "texts_encoded": self.encoded,
+            "texts_per_second": round(self.encoded / self.encode_seconds, 1) if self.encode_seconds else None
+        }
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _encode(self, texts, prompt_name):
+        raise NotImplementedError
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    name = "sentence-transformers"
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(self.model_name, device="cpu", trust_remote_code=True)
+        model.max_seq_length = 512
+        self.model = self._prepare(model)
+        self.dimension = model.get_sentence_embedding_dimension()
+        self.memory_bytes = module_bytes(self.model)
+
+    def _prepare(self, model):
+        return model
+
+    def _encode(self, texts, prompt_name):
+        if prompt_name:
+            return self.model.encode(texts, prompt_name=prompt_name, batch_size=Config.EMBEDDING_BATCH_SIZE)
+        return self.model.encode(texts, batch_size=Config.EMBEDDING_BATCH_SIZE)
+
+
+class QuantizedSentenceTransformerBackend(SentenceTransformerBackend):
+    """The same model with its Linear layers dynamically quantized to int8.
+
+    Roughly a quarter of the weight memory and faster CPU matmuls, at a
+    small cost in embedding quality.
+    """
+
+    name = "sentence-transformers-int8"
+
+    @classmethod
+    def identity(cls, model_name):
+        return f"{model_name}#int8"
+
+    def _prepare(self, model):
+        import torch
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+class HashingBackend(EmbeddingBackend):
+    """Deterministic feature hashing of words and character trigrams.
+
+    No model to download and no randomness, so it suits tests and
+    benchmarks; similarities only reflect shared spelling.
+    """
+
+    name = "hashing"
+
+    def __init__(self, model_name=None):
+        super().__init__(model_name)
+        self.model_name = self.identity(self.model_name)
+        self.dimension = Config.EMBEDDING_HASH_DIM
+
+    @classmethod
+    def identity(cls, model_name):
+        return f"hashing-{Config.EMBEDDING_HASH_DIM}"
+
+    def _load(self):
+        self.memory_bytes = 0
+
+    def _encode(self, texts, prompt_name):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in hashed_features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dimension
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+def hashed_features(text):
+    words = re.findall(r"\w+", text.lower())
+    for word in words:
+        yield word
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            yield "#" + padded[i:i + 3]
+
+
+def module_bytes(module):
+    total = 0
+    for value in module.state_dict().values():
+        for tensor in value if isinstance(value, tuple) else (value,):
+            if hasattr(tensor, "element_size"):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+EMBEDDING_BACKENDS = {
+    backend.name: backend
+    for backend in (SentenceTransformerBackend, QuantizedSentenceTransformerBackend, HashingBackend)
+}
+
+
+def embedding_backend_class(name=None):
+    name = name or Config.EMBEDDING_BACKEND
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}; expected one of {sorted(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[name]
+
+
+def create_embedding_backend(name=None, model_name=None):
+    return embedding_backend_class(name)(model_name)
+
+
+def embedding_identity(name=None, model_name=None):
+    return embedding_backend_class(name).identity(model_name or Config.EMBEDDING_MODEL)
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+import numpy as np
+from config import Config
+from modules.graph.embedding_backends import embedding_identity
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+KEY_BYTES = 16
+RECORD_BYTES = KEY_BYTES + 4
+
+
+def embedding_key(model_name, prompt_name, text):
+    return hashlib.sha256(f"{model_name}\0{prompt_name or ''}\0{text}".encode("utf-8")).digest()[:KEY_BYTES]
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store shared by every worker on the host.
+
+    Vectors are rows of a float32 file read through ``np.memmap``; the
+    index is a file of fixed-size (key, row) records. Writers append under
+    an exclusive file lock, vectors first and index records after, so a
+    reader never sees an index entry whose row isn't on disk yet. A partial
+    row or record left by a writer that died is cut off by the next writer.
+    Each process reads only the tail of the index it hasn't seen.
+    """
+
+    def __init__(self, model_name=None, cache_dir=None):
+        self.model_name = model_name or embedding_identity()
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', self.model_name)
+        self.directory = (cache_dir or Config.EMBEDDING_CACHE_DIR) / slug
+        self.vectors_file = self.directory / "vectors.f32"
+        self.index_file = self.directory / "index.bin"
+        self.meta_file = self.directory / "meta.json"
+        self.lock_file = self.directory / "lock"
+
+        self.dim = None
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}
+        self._index_offset = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def get_many(self, texts, prompt_name=None):
+        """Cached vectors for ``texts``, with None where there is no entry."""
+        keys = [embedding_key(self.model_name, prompt_name, text) for text in texts]
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._sync()
+            rows = [self._rows.get(key) for key in keys]
+            found = [row for row in rows if row is not None]
+            matrix = self._mapped(max(found) + 1) if found else None
+
+        self.hits += len(found)
+        self.misses += len(rows) - len(found)
+        return [np.array(matrix[row]) if row is not None else None for row in rows]
+
+    def put_many(self, texts, vectors, prompt_name=None):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self._lock, self._file_lock():
+            self._sync()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.meta_file.write_text(json.dumps({"model": self.model_name, "dim": self.dim}))
+            if vectors.shape[1] != self.dim:
+                logger.warning(f"Not caching {vectors.shape[1]}-d embeddings in a {self.dim}-d cache")
+                return
+
+            keys = [embedding_key(self.model_name, prompt_name, text) for text in texts]
+            new = [i for i, key in enumerate(keys) if key not in self._rows]
+            if not new:
+                return
+
+            row_bytes = self.dim * 4
+            with open(self.vectors_file, 'ab') as f:
+                # Drop a partial row left by a writer that died mid-append.
+                first_row = f.tell() // row_bytes
+                f.truncate(first_row * row_bytes)
+                f.seek(first_row * row_bytes)
+                f.write(vectors[new].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            records = b"".join(keys[i] + int(first_row + n).to_bytes(4, 'little') for n, i in enumerate(new))
+            with open(self.index_file, 'ab') as f:
+                # Likewise a partial record, which would shift every record after it.
+                f.truncate(f.tell() - f.tell() % RECORD_BYTES)
+                f.seek(0, os.SEEK_END)
+                f.write(records)
+                f.flush()
+                os.fsync(f.fileno())
+            self._sync()
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "entries": len(self._rows),
+            "dim": self.dim,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _sync(self):
+        if self.dim is None:
+            if not self.meta_file.exists():
+                return
+            self.dim = json.loads(self.meta_file.read_text())["dim"]
+        if not self.index_file.exists():
+            return
+
+        with open(self.index_file, 'rb') as f:
+            f.seek(self._index_offset)
+            tail = f.read()
+        usable = len(tail) - len(tail) % RECORD_BYTES
+        # An entry for a row that never reached the vectors file is dropped.
+        vector_rows = os.path.getsize(self.vectors_file) // (self.dim * 4) if self.vectors_file.exists() else 0
+        for start in range(0, usable, RECORD_BYTES):
+            record = tail[start:start + RECORD_BYTES]
+            row = int.from_bytes(record[KEY_BYTES:], 'little')
+            if row < vector_rows:
+                self._rows[record[:KEY_BYTES]] = row
+        self._index_offset += usable
+
+    def _mapped(self, rows_needed):
+        if self._matrix is None or self._matrix.shape[0] < rows_needed:
+            rows = os.path.getsize(self.vectors_file) // (self.dim * 4)
+            self._matrix = np.memmap(self.vectors_file, dtype=np.float32, mode='r', shape=(rows, self.dim))
+        return self._matrix
+
+    @contextmanager
+    def _file_lock(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+embedding_cache = EmbeddingCache()
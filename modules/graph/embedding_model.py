@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+from config import Config
+from modules.graph.embedding_backends import create_embedding_backend
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingUnavailable(RuntimeError):
+    """Raised when embeddings can't be computed: the model failed to load or encoding failed."""
+
+
+class EmbeddingModelLoading(EmbeddingUnavailable):
+    """Raised when embeddings are needed before the model has finished loading."""
+
+
+class EmbeddingModelLoader:
+    """Loads the configured embedding backend on a background thread.
+
+    ``sentence_transformers`` (and torch with it) is only imported by the
+    loader thread, so importing the app stays cheap and requests that don't
+    need embeddings are served while the model loads.
+    """
+
+    def __init__(self, backend_name=None, model_name=None):
+        self.backend_name = backend_name or Config.EMBEDDING_BACKEND
+        self.model_name = model_name or Config.EMBEDDING_MODEL
+        self.model = None
+        self.state = "idle"
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self.state != "idle":
+                return
+            self.state = "loading"
+            self.started_at = time.time()
+        threading.Thread(target=self._load, name="embedding-model-loader", daemon=True).start()
+
+    def get(self, timeout=0):
+        """The loaded backend, or None if it isn't loaded within ``timeout`` seconds (None waits indefinitely)."""
+        self.start()
+        self._done.wait(timeout)
+        return self.model
+
+    def ready(self):
+        return self.state == "ready"
+
+    def status(self):
+        finished = self.finished_at or time.time()
+        status = {
+            "backend": self.backend_name,
+            "model": self.model_name,
+            "state": self.state,
+            "ready": self.ready(),
+            "error": self.error,
+            "seconds": round(finished - self.started_at, 1) if self.started_at else None
+        }
+        if self.model is not None:
+            status.update(self.model.info())
+        return status
+
+    def _load(self):
+        try:
+            self.model = create_embedding_backend(self.backend_name, self.model_name).load()
+            self.state = "ready"
+            logger.info(f"Embedding backend {self.backend_name} ({self.model_name}) loaded in "
+                        f"{time.time() - self.started_at:.1f}s: {self.model.info()}")
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            logger.error(f"Error loading embedding model {self.model_name}: {e}")
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+
+embedding_loader = EmbeddingModelLoader()
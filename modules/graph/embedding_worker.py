@@ -0,0 +1,121 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from config import Config
+from modules.graph.embedding_model import embedding_loader
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingWorker:
+    """Single thread that owns the embedding backend and batches requests.
+
+    Callers ``submit`` texts and get a Future. The worker waits up to
+    ``window_ms`` after the first queued request for others to arrive (or
+    until ``max_batch`` texts are queued), encodes each prompt's distinct
+    texts in one call and hands every caller its rows. Torch releases the
+    GIL while encoding, so request threads keep running meanwhile.
+    """
+
+    def __init__(self, loader, window_ms=None, max_batch=None):
+        self.loader = loader
+        self.window = (Config.EMBEDDING_BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_batch = max_batch or Config.EMBEDDING_MAX_BATCH
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.largest_batch = 0
+        self.wait_seconds = 0.0
+
+    def submit(self, texts, prompt_name=None):
+        future = Future()
+        self._ensure_running()
+        self._queue.put((list(texts), prompt_name, future, time.perf_counter()))
+        return future
+
+    def encode(self, texts, prompt_name=None, timeout=None):
+        return self.submit(texts, prompt_name).result(timeout)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": round(self.texts / self.batches, 1) if self.batches else None,
+            "largest_batch": self.largest_batch,
+            "mean_wait_ms": round(self.wait_seconds / self.requests * 1000, 1) if self.requests else None,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch
+        }
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-worker", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            by_prompt = {}
+            for item in batch:
+                by_prompt.setdefault(item[1], []).append(item)
+            for prompt_name, items in by_prompt.items():
+                try:
+                    self._encode(prompt_name, items)
+                except Exception as e:
+                    logger.exception(f"Embedding worker error: {e}")
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.window
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _encode(self, prompt_name, items):
+        items = [item for item in items if item[2].set_running_or_notify_cancel()]
+        if not items:
+            return
+
+        texts = list(dict.fromkeys(text for item in items for text in item[0]))
+        try:
+            backend = self.loader.get(timeout=None)
+            if backend is None:
+                raise RuntimeError(f"Embedding model failed to load: {self.loader.error}")
+            vectors = backend.encode(texts, prompt_name) if texts else np.zeros((0, 0), dtype=np.float32)
+        except Exception as e:
+            for item in items:
+                item[2].set_exception(e)
+            return
+
+        row = {text: i for i, text in enumerate(texts)}
+        finished = time.perf_counter()
+        for item_texts, _, future, submitted in items:
+            future.set_result(vectors[[row[text] for text in item_texts]])
+            self.wait_seconds += finished - submitted
+
+        self.requests += len(items)
+        self.batches += 1
+        self.texts += len(texts)
+        self.largest_batch = max(self.largest_batch, len(texts))
+
+
+embedding_worker = EmbeddingWorker(embedding_loader)
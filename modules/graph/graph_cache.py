@@ -0,0 +1,105 @@
+import logging
+import threading
+from collections import OrderedDict
+from config import Config
+from modules.graph.rwlock import ReadWriteLock
+from modules.graph.store import graph_store
+
+logger = logging.getLogger(__name__)
+
+
+class GraphCache:
+    """Bounded LRU of loaded topic graphs.
+
+    The budget is a number of topics and a total number of concepts across
+    them (a proxy for memory). Graphs with uncommitted changes are flushed
+    to the store, under their topic's write lock, when they are evicted. Each topic also gets a
+    ReadWriteLock that outlives eviction, so handlers can read a graph
+    concurrently while its mutations run one at a time.
+    """
+
+    def __init__(self, max_topics=None, max_concepts=None, store=None):
+        self.max_topics = max_topics or Config.GRAPH_CACHE_MAX_TOPICS
+        self.max_concepts = max_concepts or Config.GRAPH_CACHE_MAX_CONCEPTS
+        self.store = store or graph_store
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._graphs = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, topic):
+        return topic in self._graphs
+
+    def get(self, topic):
+        with self._lock:
+            graph = self._graphs.get(topic)
+            if graph is None:
+                self.misses += 1
+                return None
+            self._graphs.move_to_end(topic)
+            self.hits += 1
+            return graph
+
+    def put(self, topic, graph):
+        with self._lock:
+            self._graphs[topic] = graph
+            self._graphs.move_to_end(topic)
+            evicted = self._evict_over_budget()
+
+        for evicted_topic, evicted_graph in evicted:
+            logger.debug(f"Evicted graph '{evicted_topic}' ({len(evicted_graph)} concepts)")
+            if evicted_graph.changes:
+                # Callers hold another topic's lock; waiting for this one here
+                # could deadlock with a writer of this topic evicting theirs.
+                threading.Thread(target=self.flush, args=(evicted_topic, evicted_graph),
+                                 name=f"graph-flush-{evicted_topic}", daemon=True).start()
+
+    def lock(self, topic):
+        with self._lock:
+            return self._locks.setdefault(topic, ReadWriteLock())
+
+    def pop(self, topic):
+        with self._lock:
+            return self._graphs.pop(topic, None)
+
+    def flush(self, topic, graph):
+        """Commit ``graph``'s pending changes under the topic's write lock."""
+        with self.lock(topic).write():
+            if not graph.changes:
+                return
+            try:
+                self.store.commit(graph)
+            except Exception as e:
+                logger.error(f"Error flushing graph '{topic}': {str(e)}")
+
+    def flush_all(self):
+        with self._lock:
+            graphs = list(self._graphs.items())
+        for topic, graph in graphs:
+            if graph.changes:
+                self.flush(topic, graph)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "topics": list(self._graphs),
+                "concepts": sum(len(graph) for graph in self._graphs.values()),
+                "max_topics": self.max_topics,
+                "max_concepts": self.max_concepts
+            }
+
+    def _evict_over_budget(self):
+        evicted = []
+        total_concepts = sum(len(graph) for graph in self._graphs.values())
+        while len(self._graphs) > 1 and (
+                len(self._graphs) > self.max_topics or total_concepts > self.max_concepts):
+            topic, graph = self._graphs.popitem(last=False)
+            total_concepts -= len(graph)
+            self.evictions += 1
+            evicted.append((topic, graph))
+        return evicted
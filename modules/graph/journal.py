@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from config import Config
+from modules.graph.concept_graph import ConceptGraph
+
+logger = logging.getLogger(__name__)
+
+
+class GraphJournal:
+    """Snapshot file plus an append-only log of graph mutations.
+
+    Each mutation appends one compact JSON line ``{"seq": n, "ops": [...]}``
+    to the journal. The snapshot records the last sequence number folded into
+    it (``journal_seq``), so replay skips records that compaction already
+    applied and a crash between the two file swaps never applies a record
+    twice. A torn final line from a crash mid-append is dropped on load.
+    """
+
+    def __init__(self, snapshot_file=None, journal_file=None, compact_every=None):
+        self.snapshot_file = Path(snapshot_file or Config.GRAPH_DATA_FILE)
+        self.journal_file = Path(journal_file or self.snapshot_file.with_suffix('.journal'))
+        self.compact_every = compact_every or Config.GRAPH_JOURNAL_COMPACT_EVERY
+
+        self.seq = 0
+        self.pending_records = 0
+        self._lock = threading.Lock()
+        self._compacting = False
+        self._generation = 0
+
+    def load(self):
+        with self._lock:
+            graph, self.seq, self.pending_records = self._replay(repair=True)
+        if graph is not None:
+            logger.debug(f"Loaded graph '{graph.core}' at journal seq {self.seq} "
+                         f"({self.pending_records} records replayed)")
+        return graph
+
+    def read(self):
+        graph, _, _ = self._replay(repair=False)
+        return graph
+
+    def append(self, ops):
+        if not ops:
+            return self.seq
+
+        with self._lock:
+            self.seq += 1
+            line = json.dumps({"seq": self.seq, "ops": ops}, separators=(",", ":")) + "\n"
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                if Config.GRAPH_JOURNAL_FSYNC:
+                    os.fsync(f.fileno())
+            self.pending_records += 1
+            seq = self.seq
+
+        if self.pending_records >= self.compact_every:
+            self.compact_in_background()
+
+        return seq
+
+    def write_snapshot(self, graph):
+        with self._lock:
+            self.seq += 1
+            self._generation += 1
+            temp_file = self._write_snapshot_file(graph.to_dict(), self.seq, '.tmp')
+            temp_file.replace(self.snapshot_file)
+            self._replace_journal(b"")
+            self.pending_records = 0
+            return self.seq
+
+    def compact_in_background(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        thread = threading.Thread(target=self.compact, name="graph-journal-compaction", daemon=True)
+        thread.start()
+
+    def compact(self):
+        try:
+            with self._lock:
+                offset = self.journal_file.stat().st_size if self.journal_file.exists() else 0
+                generation = self._generation
+
+            data = self._read_snapshot()
+            if data is None:
+                return
+
+            graph = ConceptGraph.from_dict(data)
+            folded_seq = data.get("journal_seq", 0)
+            records, _ = self._read_records(limit=offset)
+            for record in records:
+                if record["seq"] <= folded_seq:
+                    continue
+                for op in record["ops"]:
+                    graph.apply(op)
+                folded_seq = record["seq"]
+
+            temp_file = self._write_snapshot_file(graph.to_dict(), folded_seq, '.compact.tmp')
+
+            with self._lock:
+                if generation != self._generation:
+                    temp_file.unlink()
+                    return
+                temp_file.replace(self.snapshot_file)
+                tail = b""
+                if self.journal_file.exists():
+                    with open(self.journal_file, 'rb') as f:
+                        f.seek(offset)
+                        tail = f.read()
+                self._replace_journal(tail)
+                self.pending_records = tail.count(b"\n")
+
+            logger.debug(f"Compacted graph journal up to seq {folded_seq}")
+        except Exception as e:
+            logger.error(f"Error compacting graph journal: {str(e)}")
+        finally:
+            self._compacting = False
+
+    def _replay(self, repair):
+        data = self._read_snapshot()
+        if data is None:
+            return None, self.seq, 0
+
+        graph = ConceptGraph.from_dict(data)
+        seq = data.get("journal_seq", 0)
+        replayed = 0
+
+        records, valid_bytes = self._read_records()
+        if repair and self.journal_file.exists() and valid_bytes < self.journal_file.stat().st_size:
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(valid_bytes)
+
+        for record in records:
+            if record["seq"] <= seq:
+                continue
+            for op in record["ops"]:
+                graph.apply(op)
+            seq = record["seq"]
+            replayed += 1
+
+        graph.take_changes()
+        return graph, seq, replayed
+
+    def _read_snapshot(self):
+        if not self.snapshot_file.exists():
+            return None
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Error reading graph snapshot: {str(e)}")
+            return None
+
+    def _read_records(self, limit=None):
+        if not self.journal_file.exists():
+            return [], 0
+
+        with open(self.journal_file, 'rb') as f:
+            raw = f.read() if limit is None else f.read(limit)
+
+        records = []
+        valid_bytes = 0
+        for line in raw.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                logger.warning("Ignoring torn record at the end of the graph journal")
+                break
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Ignoring corrupt record at the end of the graph journal")
+                break
+            valid_bytes += len(line)
+        return records, valid_bytes
+
+    def _write_snapshot_file(self, data, seq, suffix):
+        data["journal_seq"] = seq
+        temp_file = self.snapshot_file.with_suffix(suffix)
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        return temp_file
+
+    def _replace_journal(self, content):
+        temp_file = self.journal_file.with_suffix('.journal.tmp')
+        with open(temp_file, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        temp_file.replace(self.journal_file)
@@ -0,0 +1,103 @@
+import hashlib
+import math
+from config import Config
+
+
+def radial_layout(graph, projection=None):
+    """Initial (x, y) for every concept, centred on (0, 0).
+
+    A concept sits ``level * LAYOUT_LEVEL_RADIUS`` from the centre, which is
+    where the client's radial force pulls it, inside an angular wedge of its
+    parent's sized by subtree size. With a ``projection`` (concept id to a
+    1-D embedding coordinate) siblings are ordered along it, so similar
+    siblings end up next to each other.
+    """
+    positions = {}
+    roots = graph.roots()
+    stack = []
+    total = sum(graph.subtree_size(root) for root in roots) or 1
+    start = 0.0
+    for root in roots:
+        span = 2 * math.pi * graph.subtree_size(root) / total
+        radius = 0.0 if len(roots) == 1 else Config.LAYOUT_LEVEL_RADIUS / 2
+        positions[root] = polar(radius, start + span / 2)
+        stack.append((root, start, start + span))
+        start += span
+
+    while stack:
+        concept_id, start, end = stack.pop()
+        children = graph.children_of(concept_id)
+        if not children:
+            continue
+        if projection and all(child in projection for child in children):
+            children.sort(key=projection.get)
+
+        parent_radius = math.hypot(*positions[concept_id])
+        total = sum(graph.subtree_size(child) for child in children)
+        for child in children:
+            span = (end - start) * graph.subtree_size(child) / total
+            positions[child] = polar(level_radius(graph, child, parent_radius), start + span / 2)
+            stack.append((child, start, start + span))
+            start += span
+
+    return positions
+
+
+def place_changed(graph):
+    """Positions for concepts added or moved by the graph's pending changes.
+
+    New concepts go just outside their parent, along the same ray. A moved
+    concept is placed the same way and its subtree is shifted with it.
+    """
+    positions = {}
+    for op in graph.changes:
+        if op["op"] == "add":
+            concept_id = op["concept"]["id"]
+            if concept_id in graph and graph.position(concept_id) is None:
+                positions[concept_id] = near_parent(graph, concept_id, positions)
+        elif op["op"] == "set_parent" and op["id"] in graph:
+            concept_id = op["id"]
+            old = positions.get(concept_id) or graph.position(concept_id)
+            new = positions[concept_id] = near_parent(graph, concept_id, positions)
+            if old is None:
+                continue
+            dx, dy = new[0] - old[0], new[1] - old[1]
+            for descendant in graph.descendants(concept_id):
+                current = positions.get(descendant) or graph.position(descendant)
+                if current is not None:
+                    positions[descendant] = (current[0] + dx, current[1] + dy)
+    return positions
+
+
+def near_parent(graph, concept_id, placed=None):
+    parent = graph.parent_of(concept_id)
+    if parent is None:
+        return (0.0, 0.0) if graph.level_of(concept_id) in (0, None) else \
+            polar(level_radius(graph, concept_id, 0.0), 2 * math.pi * unit_hash(concept_id))
+
+    origin = (placed or {}).get(parent) or (graph.position(parent) if parent in graph else None) or (0.0, 0.0)
+    parent_radius = math.hypot(*origin)
+    angle = math.atan2(origin[1], origin[0]) if parent_radius else 2 * math.pi * unit_hash(concept_id)
+    # Spread siblings a little either side of the parent's ray.
+    angle += (unit_hash(concept_id) - 0.5) * Config.LAYOUT_SIBLING_SPREAD
+    return polar(level_radius(graph, concept_id, parent_radius), angle)
+
+
+def level_radius(graph, concept_id, parent_radius):
+    radius = parent_radius + Config.LAYOUT_LEVEL_RADIUS
+    level = graph.level_of(concept_id)
+    if type(level) is int:
+        radius = max(radius, level * Config.LAYOUT_LEVEL_RADIUS)
+    return radius
+
+
+def has_layout(graph):
+    return all(graph.position(root) is not None for root in graph.roots())
+
+
+def polar(radius, angle):
+    return (radius * math.cos(angle), radius * math.sin(angle))
+
+
+def unit_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "little") / 2 ** 32
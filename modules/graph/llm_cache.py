@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt):
+    # Indentation and line wrapping of the f-string prompts don't change the answer.
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def response_key(model, prompt, max_tokens, system=None):
+    text = f"{model}\0{max_tokens}\0{normalize_prompt(system or '')}\0{normalize_prompt(prompt)}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Claude replies on disk, one JSON file per prompt, shared by every worker.
+
+    Entries older than ``LLM_CACHE_TTL_SECONDS`` are misses and are deleted
+    when found. A hit refreshes the file's mtime, and once the directory
+    grows past ``LLM_CACHE_MAX_MB`` the least recently used files are
+    removed until it is back under 90% of that. Files are written to a
+    temporary name and renamed, so readers never see a partial entry.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or Config.LLM_CACHE_DIR
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        self._bytes = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if time.time() - entry["created"] > Config.LLM_CACHE_TTL_SECONDS:
+            self.expired += 1
+            self.misses += 1
+            self._delete(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        self.saved_seconds += entry.get("seconds") or 0
+        return entry["text"]
+
+    def put(self, key, text, seconds=None, **meta):
+        entry = dict(meta, text=text, created=time.time(), seconds=seconds)
+        data = json.dumps(entry)
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self.stores += 1
+            if self._bytes is not None:
+                self._bytes += len(data)
+        if self._size() > Config.LLM_CACHE_MAX_MB * 1024 * 1024:
+            self._evict()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": Config.LLM_CACHE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "expired": self.expired,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "saved_seconds": round(self.saved_seconds, 1),
+            "bytes": self._bytes
+        }
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _entries(self):
+        if not self.directory.exists():
+            return []
+        return list(self.directory.glob("*/*.json"))
+
+    def _size(self):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(path.stat().st_size for path in self._entries())
+            return self._bytes
+
+    def _evict(self):
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = Config.LLM_CACHE_MAX_MB * 1024 * 1024 * 0.9
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            self._delete(path)
+            total -= size
+            removed += 1
+
+        with self._lock:
+            self._bytes = total
+            self.evictions += removed
+        logger.info(f"Evicted {removed} LLM cache entries ({total} bytes left)")
+
+    def _delete(self, path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+llm_cache = LLMResponseCache()
@@ -0,0 +1,246 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from modules.graph.llm_cache import llm_cache, response_key
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without calling the API while the circuit breaker is open."""
+
+
+class LLMClient:
+    """Shared HTTP client for the Claude messages API.
+
+    One pooled keep-alive session serves every caller. Each attempt has
+    connect and read timeouts; 429s, 5xx and connection errors are retried
+    up to ``LLM_MAX_RETRIES`` times with jittered exponential backoff
+    (honouring Retry-After). After ``LLM_BREAKER_FAILURES`` failed calls
+    in a row the breaker opens and calls fail fast for
+    ``LLM_BREAKER_RESET_SECONDS``, then one trial call is let through.
+    Failures raise ``requests.RequestException`` subclasses, as a bare
+    ``requests.post`` would.
+    """
+
+    def __init__(self, url=None):
+        # None reads Config.CLAUDE_API_URL on every call, so it can be
+        # pointed at a local stand-in server.
+        self.url = url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.LLM_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._latencies = {}
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+        self.rejected = 0
+
+    def create_message(self, payload, timeout=None, name="default"):
+        """POST ``payload`` and return the decoded response. ``timeout`` bounds
+        the whole call, retries included."""
+        return self._send(payload, timeout, name, stream=False)
+
+    def stream_message(self, payload, timeout=None, name="default"):
+        """Yield the API's streamed events for ``payload`` as dicts. Retries
+        and the breaker apply until the response starts; after that the read
+        timeout is per chunk. Closing the generator closes the connection,
+        which stops generation upstream."""
+        response = self._send(dict(payload, stream=True), timeout, name, stream=True)
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    yield json.loads(line[5:])
+        finally:
+            response.close()
+
+    def _send(self, payload, timeout, name, stream):
+        trial = self._admit()
+        try:
+            return self._attempt(payload, timeout, name, stream)
+        finally:
+            if trial:
+                # The trial call must settle the breaker however it ended,
+                # or no call would ever be admitted again.
+                with self._lock:
+                    self._trial = False
+
+    def _attempt(self, payload, timeout, name, stream):
+        deadline = time.monotonic() + timeout if timeout else None
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            read_timeout = Config.LLM_READ_TIMEOUT
+            if deadline is not None:
+                read_timeout = max(0.1, min(read_timeout, deadline - time.monotonic()))
+            try:
+                response = self.session.post(
+                    self.url or Config.CLAUDE_API_URL,
+                    headers=self._headers(),
+                    json=payload,
+                    timeout=(Config.LLM_CONNECT_TIMEOUT, read_timeout),
+                    stream=stream
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    # A stream's latency is the time to its first byte.
+                    data = response if stream else response.json()
+                    self._record(name, started, ok=True)
+                    return data
+                error = requests.HTTPError(f"{response.status_code} from Claude API", response=response)
+                delay = retry_after(response)
+                response.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error, delay = e, None
+            except requests.RequestException:
+                # Client errors (400, 401, ...) will not succeed on retry and
+                # say nothing about the upstream's health.
+                self._record(name, started, ok=None)
+                raise
+            except Exception:
+                self._record(name, started, ok=False)
+                raise
+
+            delay = backoff(attempt) if delay is None else delay
+            if attempt >= Config.LLM_MAX_RETRIES or (deadline is not None and time.monotonic() + delay >= deadline):
+                self._record(name, started, ok=False)
+                raise error
+            logger.warning(f"Claude API call failed ({error}); retry {attempt + 1} in {delay:.2f}s")
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+            attempt += 1
+
+    def complete(self, prompt, max_tokens=1000, model=None, system=None, timeout=None, name="default",
+                 cache=False, validate=None):
+        """Text of the reply to a single user ``prompt``. With ``cache``, a reply
+        to the same model, prompt and max_tokens is served from llm_cache.
+        ``validate`` is the caller's check that a reply parses; replies it
+        rejects are neither stored nor served from the cache."""
+        model = model or Config.CLAUDE_MODEL
+        key = None
+        if cache and Config.LLM_CACHE_ENABLED:
+            key = response_key(model, prompt, max_tokens, system)
+            text = llm_cache.get(key)
+            if text is not None and (validate is None or validate(text)):
+                return text
+
+        payload = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        if system:
+            payload["system"] = system
+        started = time.perf_counter()
+        data = self.create_message(payload, timeout=timeout, name=name)
+        text = message_text(data)
+        # A reply cut off at max_tokens is usually unparseable; don't keep it.
+        if key is not None and text and data.get("stop_reason") != "max_tokens" \
+                and (validate is None or validate(text)):
+            llm_cache.put(key, text, seconds=time.perf_counter() - started, model=model, caller=name)
+        return text
+
+    def stats(self):
+        with self._lock:
+            return {
+                "url": self.url or Config.CLAUDE_API_URL,
+                "breaker": self._state(),
+                "consecutive_failures": self._failures,
+                "calls": self.calls,
+                "retries": self.retries,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "latency_ms": {name: latency_summary(samples) for name, samples in self._latencies.items()},
+                "cache": llm_cache.stats()
+            }
+
+    def _headers(self):
+        return {
+            "x-api-key": Config.CLAUDE_API_KEY,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self._trial or time.monotonic() - self._opened_at >= Config.LLM_BREAKER_RESET_SECONDS:
+            return "half-open"
+        return "open"
+
+    def _admit(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return False
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            self.rejected += 1
+        raise CircuitOpenError("Claude API circuit breaker is open")
+
+    def _record(self, name, started, ok):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.calls += 1
+            self._latencies.setdefault(name, deque(maxlen=1000)).append(elapsed)
+            if ok is None:
+                # A client error proves the upstream answers.
+                ok = True
+                self.errors += 1
+            if ok:
+                self._failures, self._opened_at, self._trial = 0, None, False
+                return
+            self.errors += 1
+            self._failures += 1
+            if self._trial or self._failures >= Config.LLM_BREAKER_FAILURES:
+                if self._opened_at is None or self._trial:
+                    logger.error(f"Claude API circuit breaker opened after {self._failures} failed calls")
+                self._opened_at, self._trial = time.monotonic(), False
+
+
+def backoff(attempt):
+    # Full jitter: uniform over [0, base * 2^attempt], capped.
+    return random.uniform(0, min(Config.LLM_BACKOFF_MAX_SECONDS, Config.LLM_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def retry_after(response):
+    try:
+        return min(float(response.headers.get("retry-after")), Config.LLM_BACKOFF_MAX_SECONDS)
+    except (TypeError, ValueError):
+        return None
+
+
+def message_text(data):
+    content = data.get("content") or []
+    return content[0].get("text", "") if content else ""
+
+
+def latency_summary(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    return {
+        "count": len(ordered),
+        "p50": round(ordered[len(ordered) // 2], 1),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        "max": round(ordered[-1], 1)
+    }
+
+
+llm_client = LLMClient()
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import numpy as np
+from config import Config
+from modules.graph.embedding_backends import embedding_identity
+from modules.graph.embedding_model import embedding_loader
+from modules.graph.snapshot import graph_snapshots
+
+logger = logging.getLogger(__name__)
+
+# Extra neighbours fetched per concept to make up for ones dropped as same-branch.
+LINEAGE_SLACK = 16
+
+
+class RelatedEdges:
+    """Top-k semantically nearest concepts in *other* branches, for one topic.
+
+    A concept's neighbours never include its ancestors or descendants. The
+    similarity matrix is computed a block of rows at a time against the
+    topic's VectorIndex, with the block height set so that one block fits
+    in ``RELATED_RAM_BUDGET_MB``; n x n is never held. A refresh only
+    recomputes concepts that were added or moved, or that lost a neighbour,
+    and offers the new concepts to everyone else's lists.
+    """
+
+    def __init__(self, topic, k=None, directory=None):
+        self.topic = topic
+        self.k = k or Config.RELATED_K
+        digest = hashlib.sha1(topic.encode("utf-8")).hexdigest()[:8]
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', topic)[:40]
+        self.path = (directory or Config.RELATED_DIR) / f"{slug}-{digest}.json"
+        self.identity = embedding_identity()
+        self.version = None
+        self.neighbours = {}
+        self.parents = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def edges(self):
+        """Each related pair once, as (a, b, similarity 0-100)."""
+        with self._lock:
+            pairs = {}
+            for concept_id, neighbours in self.neighbours.items():
+                for other, score in neighbours:
+                    pairs[(concept_id, other) if concept_id < other else (other, concept_id)] = score
+        return [(a, b, score) for (a, b), score in pairs.items()]
+
+    def refresh(self, graph, index):
+        """Bring the edges up to ``graph``'s version. Returns False if the
+        index moved on underneath us and the refresh must be retried."""
+        index.sync(graph)
+        version = index.version
+        current = {concept_id: graph.parent_of(concept_id) for concept_id in graph.ids()}
+
+        with self._lock:
+            neighbours = dict(self.neighbours)
+            removed = {concept_id for concept_id in neighbours if concept_id not in current}
+            for concept_id in removed:
+                del neighbours[concept_id]
+
+            changed, moved = set(), set()
+            for concept_id, parent in current.items():
+                if concept_id not in neighbours:
+                    changed.add(concept_id)
+                elif self.parents.get(concept_id) != parent:
+                    moved.add(concept_id)
+                    moved.update(graph.descendants(concept_id))
+            changed |= moved
+            # Lists holding a removed or moved concept are recomputed: a moved
+            # one may now sit in the same branch as the list's owner.
+            gone = removed | moved
+            dirty = set(changed)
+            if gone:
+                dirty.update(c for c, items in neighbours.items() if any(other in gone for other, _ in items))
+
+        full = len(dirty) * 2 > len(current)
+        if full:
+            dirty, changed, neighbours = set(current), set(), {}
+        if not dirty:
+            with self._lock:
+                self.neighbours, self.parents, self.version = neighbours, current, version
+            return True
+
+        ancestors = {}
+
+        def lineage(concept_id):
+            if concept_id not in ancestors:
+                ancestors[concept_id] = set(graph.ancestors(concept_id))
+            return ancestors[concept_id]
+
+        def same_branch(a, b):
+            return a == b or b in lineage(a) or a in lineage(b)
+
+        budget_rows = Config.RELATED_RAM_BUDGET_MB * 1024 * 1024 // (12 * max(1, len(current)))
+        block_rows = max(1, min(budget_rows, Config.RELATED_MAX_BLOCK_ROWS))
+        order = sorted(dirty)
+        thresholds = None
+        min_score = Config.RELATED_MIN_SIMILARITY / 100
+
+        for start in range(0, len(order), block_rows):
+            block = order[start:start + block_rows]
+            result = index.score_block(block, version)
+            if result is None:
+                return False
+            scores, ids = result
+
+            want = min(len(ids), self.k + LINEAGE_SLACK)
+            nearest = np.argpartition(-scores, want - 1, axis=1)[:, :want] if want < len(ids) else \
+                np.tile(np.arange(len(ids)), (len(block), 1))
+            for r, concept_id in enumerate(block):
+                top = nearest[r][np.argsort(-scores[r, nearest[r]])]
+                items = []
+                for col in top:
+                    if scores[r, col] < min_score or len(items) == self.k:
+                        break
+                    if not same_branch(concept_id, ids[col]):
+                        items.append((ids[col], round(float(scores[r, col]) * 100, 2)))
+                neighbours[concept_id] = items
+
+            # New and moved concepts may displace entries in everyone else's lists.
+            offer = [r for r, concept_id in enumerate(block) if concept_id in changed]
+            if not offer:
+                continue
+            if thresholds is None:
+                thresholds = np.array([self._threshold(neighbours.get(concept_id), min_score) for concept_id in ids])
+            rows, cols = np.nonzero(scores[offer] > thresholds)
+            for r, col in zip(rows, cols):
+                concept_id, other = block[offer[r]], ids[col]
+                if other in dirty or same_branch(concept_id, other):
+                    continue
+                items = [item for item in neighbours.get(other, []) if item[0] != concept_id]
+                items.append((concept_id, round(float(scores[offer[r], col]) * 100, 2)))
+                items.sort(key=lambda item: item[1], reverse=True)
+                neighbours[other] = items[:self.k]
+                thresholds[col] = self._threshold(neighbours[other], min_score)
+
+        with self._lock:
+            self.neighbours, self.parents, self.version = neighbours, current, version
+        self._save()
+        logger.info(f"Refreshed related edges for '{self.topic}' at version {version}: "
+                    f"{len(order)} of {len(current)} concepts recomputed")
+        return True
+
+    def _threshold(self, items, min_score):
+        if items is None:
+            return np.inf
+        if len(items) < self.k:
+            return min_score
+        return items[-1][1] / 100
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        if data.get("identity") != self.identity or data.get("k") != self.k:
+            return
+        self.version = data["version"]
+        self.neighbours = {c: [tuple(item) for item in items] for c, items in data["neighbours"].items()}
+        self.parents = data["parents"]
+
+    def _save(self):
+        with self._lock:
+            data = {
+                "topic": self.topic,
+                "identity": self.identity,
+                "k": self.k,
+                "version": self.version,
+                "neighbours": self.neighbours,
+                "parents": self.parents
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, self.path)
+
+
+class RelatedEdgeJob:
+    """Background thread that refreshes RelatedEdges for topics that asked for them."""
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.refreshes = 0
+        self.retries = 0
+        self._topics = {}
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def get(self, topic):
+        with self._lock:
+            edges = self._topics.get(topic)
+            if edges is None:
+                edges = self._topics[topic] = RelatedEdges(topic)
+            return edges
+
+    def tracked(self, topic):
+        return topic in self._topics
+
+    def schedule(self, topic):
+        with self._lock:
+            if topic in self._queued:
+                return
+            self._queued.add(topic)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="related-edges", daemon=True)
+                self._thread.start()
+        self._queue.put(topic)
+
+    def stats(self):
+        return {
+            "queued": sorted(self._queued),
+            "refreshes": self.refreshes,
+            "retries": self.retries,
+            "topics": {topic: {"version": edges.version, "concepts": len(edges.neighbours)}
+                       for topic, edges in list(self._topics.items())}
+        }
+
+    def _run(self):
+        while True:
+            topic = self._queue.get()
+            with self._lock:
+                self._queued.discard(topic)
+            try:
+                if embedding_loader.get(timeout=None) is None:
+                    continue
+                snapshot = graph_snapshots.get(topic)
+                if snapshot is None:
+                    continue
+                if self.get(topic).refresh(snapshot.graph, self.indexes.get(topic)):
+                    self.refreshes += 1
+                else:
+                    self.retries += 1
+                    self.schedule(topic)
+            except Exception as e:
+                logger.exception(f"Related edge refresh failed for '{topic}': {e}")
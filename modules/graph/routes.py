@@ -1,17 +1,143 @@
-from flask import jsonify, render_template, request, send_from_directory
+from flask import Response, jsonify, render_template, request, send_from_directory, stream_with_context
 import json
 import os
+import time
+from contextlib import contextmanager
 from modules.graph import graph_bp
 from modules.graph.utils import (
-    build_or_load_graph, add_concept, delete_concept, 
-    rename_concept, insert_node_between, expand_node,
-    find_best_parent_for_term, prepare_d3_data,
-    load_embedding_model, calculate_similarities
+    build_or_load_graph, add_concept, delete_concept,
+    rename_concept, insert_node_between, generate_expansion, apply_expansion,
+    place_term, get_parent_for_concept, prepare_d3_data, prepare_d3_delta,
+    prepare_d3_subtree, similarity_available, score_missing_edges, save_graph, vector_indexes,
+    related_links, layout_graph, generate_hierarchy_batches, sse_event
 )
+from modules.graph.concept_graph import ConceptGraph
+from modules.graph.store import graph_store, GraphConflictError
+from modules.graph.graph_cache import GraphCache
+from modules.graph.snapshot import graph_snapshots
+from modules.graph.embedding_model import embedding_loader, EmbeddingModelLoading, EmbeddingUnavailable
+from modules.graph.embedding_cache import embedding_cache
+from modules.graph.embedding_worker import embedding_worker
+from modules.graph.related import RelatedEdgeJob
+from modules.graph.layout import has_layout
+from modules.graph.llm_client import llm_client
 from config import Config
 
-global_data = None
-global_topic = "Machine Learning"
+DEFAULT_TOPIC = "Machine Learning"
+
+graph_cache = GraphCache()
+related_edges = RelatedEdgeJob(vector_indexes)
+
+def default_topic():
+    return graph_store.active_topic() or DEFAULT_TOPIC
+
+def request_topic(data):
+    return data.get('core_topic') or default_topic()
+
+def current_topic_graph(topic):
+    """Cached graph for ``topic``, reloaded if another worker has committed since it was cached."""
+    graph = graph_cache.get(topic)
+    store_version = graph_store.version(topic)
+    if graph is None or (store_version is not None and store_version != graph.version):
+        graph = graph_store.load(topic)
+        if graph is not None:
+            graph_cache.put(topic, graph)
+    return graph
+
+def load_topic_graph(topic, force_regenerate=False):
+    # Callers hold the topic's write lock: this may generate the graph.
+    graph = None if force_regenerate else current_topic_graph(topic)
+    if graph is None:
+        graph = build_or_load_graph(topic, force_regenerate, calculate_similarities=False)
+        graph_cache.put(topic, graph)
+    if not has_layout(graph):
+        # Graphs saved before layouts were stored get one on first load.
+        layout_graph(graph)
+        save_graph(graph)
+    return graph
+
+def layout_only_since(graph, version):
+    """True if every commit after ``version`` only stored layout positions,
+    like the one load_topic_graph makes for a graph saved without them."""
+    entries = [ops for entry_version, ops in graph.history if entry_version > version]
+    return 0 < len(entries) == graph.version - version and \
+        all(op["op"] == "set_positions" for ops in entries for op in ops)
+
+@contextmanager
+def reading_graph(topic):
+    with graph_cache.lock(topic).read():
+        yield current_topic_graph(topic)
+
+@contextmanager
+def writing_graph(topic, data, create=False):
+    """Hold the topic's write lock and check the request's ``base_version``.
+
+    If the body raises -- a commit that lost a race with another worker
+    process, or any error part-way through an edit -- the cached graph may
+    hold edits that were never written, so it is dropped and the next
+    request reloads it from the store.
+    """
+    with graph_cache.lock(topic).write():
+        graph = load_topic_graph(topic) if create else current_topic_graph(topic)
+        base_version = data.get('base_version')
+        if graph is not None and base_version is not None and int(base_version) != graph.version \
+                and not layout_only_since(graph, int(base_version)):
+            raise GraphConflictError(topic, int(base_version), graph.version)
+        try:
+            yield graph
+        except BaseException:
+            graph_cache.pop(topic)
+            raise
+        if graph is not None:
+            graph_snapshots.update(graph)
+    
+    if related_edges.tracked(topic):
+        related_edges.schedule(topic)
+
+def topic_snapshot(topic, create=False):
+    """GraphSnapshot of ``topic``; with ``create``, a missing topic is
+    generated under its write lock first, as /get_graph_data would."""
+    snapshot = graph_snapshots.get(topic)
+    if snapshot is None and create:
+        with graph_cache.lock(topic).write():
+            snapshot = graph_snapshots.update(load_topic_graph(topic), create=True)
+    return snapshot
+
+def snapshot_graph(topic, create=False):
+    """Read-only copy of the graph for slow work (LLM prompts) done outside the lock."""
+    snapshot = topic_snapshot(topic, create)
+    return snapshot.graph if snapshot is not None else None
+
+def page_limits(data):
+    """The client's lazy-loading ``max_depth`` and ``max_children``, from the
+    request body or the query string (None when not given)."""
+    limits = []
+    for name in ('max_depth', 'max_children'):
+        value = data.get(name)
+        limits.append(int(value) if value is not None else request.args.get(name, type=int))
+    return limits
+
+def graph_payload(graph, data, using_similarities=False):
+    client_version = data.get('client_version')
+    if client_version is not None:
+        delta = prepare_d3_delta(graph, int(client_version), using_similarities)
+        if delta is not None:
+            return {"version": graph.version, "delta": delta}
+    
+    # A client too far behind for a delta reloads the same window it asked
+    # for in /get_graph_data, not the whole graph.
+    max_depth, max_children = page_limits(data)
+    return {"version": graph.version, "graph_data": prepare_d3_data(graph, using_similarities, max_depth, max_children)}
+
+def conflict_response(topic, data, using_similarities=False):
+    with reading_graph(topic) as graph:
+        payload = graph_payload(graph, data, using_similarities) if graph is not None else {}
+    return jsonify({
+        "success": False,
+        "conflict": True,
+        "error": "The graph was changed by someone else and has been refreshed. Please try again.",
+        **payload
+    }), 409
 
 @graph_bp.route('/')
 def index():
@@ -23,171 +149,420 @@ def index_html():
 
 @graph_bp.route('/get_graph_data', methods=['GET'])
 def get_graph_data():
-    global global_data, global_topic
-    topic = request.args.get('topic', global_topic)
+    topic = request.args.get('topic') or default_topic()
     force_regenerate = request.args.get('force', 'false').lower() == 'true'
     use_similarities = request.args.get('use_similarities', 'false').lower() == 'true'
+    max_depth = request.args.get('max_depth', type=int)
+    max_children = request.args.get('max_children', type=int)
+    include_related = request.args.get('related', 'false').lower() == 'true'
+    stream = request.args.get('stream', 'false').lower() == 'true'
+    # Until the embedding model is loaded, serve the similarities already stored.
+    compute_similarities = use_similarities and similarity_available()
+    edges = related_edges.get(topic) if include_related else None
+    related = edges.edges() if edges is not None else None
+    
+    graph_data = None
+    if not force_regenerate and not compute_similarities:
+        with reading_graph(topic) as graph:
+            if graph is not None and has_layout(graph):
+                version = graph.version
+                graph_data = prepare_d3_data(graph, use_similarities, max_depth, max_children, related)
     
-    if global_data is None or topic != global_topic or force_regenerate:
-        global_topic = topic
-        global_data = build_or_load_graph(topic, force_regenerate, calculate_similarities=False)
+    if graph_data is None and stream and (force_regenerate or graph_store.version(topic) is None):
+        # The client fetches /generate_stream instead of waiting here.
+        return jsonify({"topic": topic, "generating": True})
     
-    if use_similarities and 'concepts' in global_data:
-        if 'relationships' not in global_data:
-            global_data['relationships'] = {}
+    if graph_data is None:
+        with graph_cache.lock(topic).write():
+            graph = load_topic_graph(topic, force_regenerate)
             
-        global_data['relationships'] = calculate_similarities(
-            global_data['concepts'], 
-            existing_relationships=global_data.get('relationships', {})
-        )
+            if compute_similarities and score_missing_edges(graph):
+                save_graph(graph)
+            
+            version = graph.version
+            graph_data = prepare_d3_data(graph, use_similarities, max_depth, max_children, related)
+    
+    if graph_store.active_topic() != topic:
+        graph_store.set_active_topic(topic)
+    
+    related_pending = edges is not None and edges.version != version
+    if related_pending:
+        related_edges.schedule(topic)
+    
+    return jsonify({
+        "topic": topic,
+        "version": version,
+        "graph_data": graph_data,
+        "similarities_pending": use_similarities and not compute_similarities,
+        "related_pending": related_pending
+    })
+
+@graph_bp.route('/generate_stream', methods=['GET'])
+def generate_stream():
+    """Generate ``topic`` breadth-first as server-sent events: ``graph`` with the
+    root and its children, a ``delta`` as each concept's expansion arrives, then
+    ``done``. Every batch is saved before it is sent. A topic that already
+    exists (without ``force``) is sent as one ``graph`` event."""
+    topic = request.args.get('topic') or default_topic()
+    force_regenerate = request.args.get('force', 'false').lower() == 'true'
+    max_depth = request.args.get('max_depth', type=int)
+    max_children = request.args.get('max_children', type=int)
+    
+    def graph_event(graph):
+        return sse_event("graph", {
+            "topic": topic,
+            "version": graph.version,
+            "graph_data": prepare_d3_data(graph, max_depth=max_depth, max_children=max_children)
+        })
+    
+    def events():
+        graph = None
+        if not force_regenerate and graph_store.version(topic) is not None:
+            with graph_cache.lock(topic).write():
+                graph = load_topic_graph(topic)
+                event = graph_event(graph)
+            yield event
+            yield sse_event("done", {"version": graph.version, "concepts": len(graph)})
+            return
+        
+        batches = generate_hierarchy_batches(topic, cache=not force_regenerate)
+        try:
+            for batch in batches:
+                with graph_cache.lock(topic).write():
+                    if graph is None:
+                        graph = ConceptGraph(topic, batch, {})
+                        layout_graph(graph)
+                        graph_store.save(graph)
+                        graph_store.set_active_topic(topic)
+                        graph_cache.put(topic, graph)
+                        event = graph_event(graph)
+                    else:
+                        graph = current_topic_graph(topic)
+                        if graph is None:
+                            break
+                        version = graph.version
+                        for concept in batch:
+                            if concept["id"] not in graph and concept["parent"] in graph:
+                                graph.add(concept["id"], concept["parent"], concept["level"])
+                        try:
+                            save_graph(graph)
+                        except GraphConflictError:
+                            # Another worker wrote the topic; this batch is dropped.
+                            graph_cache.pop(topic)
+                            continue
+                        event = sse_event("delta", {"version": graph.version, "delta": prepare_d3_delta(graph, version)})
+                yield event
+        except Exception as e:
+            print(f"Error in generate_stream: {e}")
+            yield sse_event("error", {"error": str(e)})
+        finally:
+            batches.close()
         
-        with open(Config.GRAPH_DATA_FILE, 'w') as f:
-            json.dump(global_data, f, indent=2)
+        if graph is not None:
+            if related_edges.tracked(topic):
+                related_edges.schedule(topic)
+            yield sse_event("done", {"version": graph.version, "concepts": len(graph)})
     
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@graph_bp.route('/related_links', methods=['POST'])
+def get_related_links():
+    """Cross-branch links between the concepts in ``ids`` (those the client has loaded)."""
+    data = request.json or {}
+    topic = request_topic(data)
+    
+    edges = related_edges.get(topic)
+    store_version = graph_store.version(topic)
+    if edges.version != store_version:
+        related_edges.schedule(topic)
+    
+    nodes = [{"id": concept_id} for concept_id in data.get('ids', [])]
     return jsonify({
         "topic": topic,
-        "graph_data": prepare_d3_data(global_data, using_similarities=use_similarities)
+        "version": edges.version,
+        "pending": edges.version != store_version,
+        "related_links": related_links(nodes, edges.edges())
     })
 
+@graph_bp.route('/children/<path:concept_id>', methods=['GET'])
+def get_children(concept_id):
+    topic = request.args.get('topic') or default_topic()
+    cursor = request.args.get('cursor') or None
+    limit = request.args.get('limit', 50, type=int)
+    use_similarities = request.args.get('use_similarities', 'false').lower() == 'true'
+    
+    with reading_graph(topic) as graph:
+        if graph is None or concept_id not in graph:
+            return jsonify({"success": False, "error": "Concept not found"}), 404
+        
+        try:
+            page, remaining = graph.children_page(concept_id, cursor, limit)
+        except KeyError:
+            return jsonify({"success": False, "error": "Cursor is no longer a child of this concept"}), 400
+        
+        return jsonify({
+            "success": True,
+            "parent": concept_id,
+            "version": graph.version,
+            "child_count": graph.child_count(concept_id),
+            "remaining": remaining,
+            "next_cursor": page[-1] if page and remaining else None,
+            **prepare_d3_subtree(graph, page, use_similarities, max_depth=0, link_to_parent=True)
+        })
+
+@graph_bp.route('/ancestors/<path:concept_id>', methods=['GET'])
+def get_ancestors(concept_id):
+    topic = request.args.get('topic') or default_topic()
+    
+    with reading_graph(topic) as graph:
+        if graph is None or concept_id not in graph:
+            return jsonify({"success": False, "error": "Concept not found"}), 404
+        
+        ancestors = graph.ancestors(concept_id)
+        return jsonify({
+            "success": True,
+            "concept_id": concept_id,
+            "ancestors": ancestors,
+            "path": ancestors[::-1] + [concept_id],
+            "subtree_size": graph.subtree_size(concept_id),
+            "version": graph.version
+        })
+
+@graph_bp.route('/similar_concepts', methods=['GET'])
+def similar_concepts():
+    topic = request.args.get('topic') or default_topic()
+    query = request.args.get('q', '').strip()
+    k = max(1, min(request.args.get('k', 10, type=int), 100))
+    
+    if not query:
+        return jsonify({"success": False, "error": "Missing query parameter q"}), 400
+    if not similarity_available():
+        return jsonify({"success": False, "pending": True, "error": "The embedding model is still loading"}), 503
+    
+    graph = snapshot_graph(topic)
+    if graph is None:
+        return jsonify({"success": False, "error": "Topic not found"}), 404
+    
+    started = time.perf_counter()
+    try:
+        matches = vector_indexes.nearest(graph, query, k, exclude=(query,))
+    except EmbeddingModelLoading as e:
+        # Also raised while the topic's vector index is being built.
+        return jsonify({"success": False, "pending": True, "error": str(e)}), 503
+    except EmbeddingUnavailable as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    
+    return jsonify({
+        "success": True,
+        "topic": topic,
+        "query": query,
+        "version": graph.version,
+        "results": [{"id": concept_id, "similarity": round(similarity, 2)} for concept_id, similarity in matches],
+        "took_ms": round((time.perf_counter() - started) * 1000, 2)
+    })
+
+@graph_bp.route('/topics', methods=['GET'])
+def list_topics():
+    return jsonify({"topics": graph_store.topics(), "active_topic": graph_store.active_topic()})
+
+@graph_bp.route('/health/ready', methods=['GET'])
+def health_ready():
+    status = embedding_loader.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@graph_bp.route('/embeddings/stats', methods=['GET'])
+def embedding_stats():
+    return jsonify({
+        "backend": embedding_loader.status(),
+        "worker": embedding_worker.stats(),
+        "cache": embedding_cache.stats(),
+        "vector_indexes": vector_indexes.stats(),
+        "related_edges": related_edges.stats()
+    })
+
+@graph_bp.route('/llm/stats', methods=['GET'])
+def llm_stats():
+    return jsonify(llm_client.stats())
+
+@graph_bp.route('/graph_cache/stats', methods=['GET'])
+def graph_cache_stats():
+    return jsonify(graph_cache.stats())
+
+@graph_bp.route('/export_graph', methods=['GET'])
+def export_graph():
+    topic = request.args.get('topic') or default_topic()
+    graph_cache.flush_all()
+    data = graph_store.export_json(topic)
+    
+    if data is None:
+        return jsonify({"success": False, "error": "Topic not found"}), 404
+    
+    response = jsonify(data)
+    response.headers['Content-Disposition'] = 'attachment; filename="concept_graph_data.json"'
+    return response
+
+@graph_bp.route('/import_graph', methods=['POST'])
+def import_graph():
+    data = request.json
+    if not data or not data.get('core') or not isinstance(data.get('concepts'), list):
+        return jsonify({"success": False, "error": "Expected a {core, concepts, relationships} graph"})
+    
+    try:
+        graph = ConceptGraph.from_dict(data)
+        with graph_cache.lock(graph.core).write():
+            graph_store.save(graph)
+            graph_cache.put(graph.core, graph)
+        graph_store.set_active_topic(graph.core)
+        
+        return jsonify({"success": True, "topic": graph.core, "concept_count": len(graph)})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
 @graph_bp.route('/add_concept', methods=['POST'])
 def add_concept_api():
-    global global_data, global_topic
-    
     data = request.json
     new_concept = data.get('concept')
     parent_id = data.get('parent')
     level = data.get('level')
-    topic = data.get('core_topic', global_topic)
+    topic = request_topic(data)
     calculate_similarity = data.get('calculate_similarity', False)
     
     if not new_concept:
         return jsonify({"success": False, "error": "No concept provided"})
     
-    if global_data is None or topic != global_topic:
-        global_topic = topic
-        global_data = build_or_load_graph(topic)
-    
     try:
-        updated_data, success = add_concept(global_data, new_concept, parent_id, level, calculate_similarity)
+        if parent_id is None or level is None:
+            parent_id, level = get_parent_for_concept(topic, new_concept, snapshot_graph(topic, create=True))
         
-        if success:
-            global_data = updated_data
-            return jsonify({
-                "success": True, 
-                "graph_data": prepare_d3_data(global_data, using_similarities=calculate_similarity)
-            })
-        else:
-            return jsonify({"success": False, "error": "Concept already exists"})
+        with writing_graph(topic, data, create=True) as graph:
+            graph, success = add_concept(graph, new_concept, parent_id, level, calculate_similarity)
+            
+            if success:
+                return jsonify({
+                    "success": True,
+                    **graph_payload(graph, data, calculate_similarity)
+                })
+            else:
+                return jsonify({"success": False, "error": "Concept already exists"})
+    except GraphConflictError:
+        return conflict_response(topic, data, calculate_similarity)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
 @graph_bp.route('/auto_add_term', methods=['POST'])
 def auto_add_term_api():
-    global global_data, global_topic
-    
     data = request.json
     new_term = data.get('term')
-    topic = data.get('core_topic', global_topic)
+    topic = request_topic(data)
     calculate_similarity = data.get('calculate_similarity', False)
     
     if not new_term:
         return jsonify({"success": False, "error": "No term provided"})
     
-    if global_data is None or topic != global_topic:
-        global_topic = topic
-        global_data = build_or_load_graph(topic)
-    
     try:
-        if any(c["id"] == new_term for c in global_data["concepts"]):
+        planning_graph = snapshot_graph(topic, create=True)
+        if new_term in planning_graph:
             return jsonify({"success": False, "error": "Term already exists in the graph"})
         
-        parent_id, level, reason = find_best_parent_for_term(
-            global_topic, new_term, global_data["concepts"]
+        parent_id, level, reason, placement = place_term(
+            topic, new_term, planning_graph
         )
         
-        updated_data, success = add_concept(
-            global_data, new_term, parent_id, level, calculate_similarity
-        )
-        
-        if success:
-            global_data = updated_data
-            return jsonify({
-                "success": True,
-                "graph_data": prepare_d3_data(global_data, using_similarities=calculate_similarity),
-                "parent_node": parent_id,
-                "level": level,
-                "reason": reason
-            })
-        else:
-            return jsonify({"success": False, "error": "Failed to add term"})
+        with writing_graph(topic, data) as graph:
+            graph, success = add_concept(
+                graph, new_term, parent_id, level, calculate_similarity
+            )
+            
+            if success:
+                return jsonify({
+                    "success": True,
+                    **graph_payload(graph, data, calculate_similarity),
+                    "parent_node": parent_id,
+                    "level": level,
+                    "reason": reason,
+                    "placement": placement
+                })
+            else:
+                return jsonify({"success": False, "error": "Failed to add term"})
+    except GraphConflictError:
+        return conflict_response(topic, data, calculate_similarity)
     except Exception as e:
         print(f"Error in auto_add_term: {e}")
         return jsonify({"success": False, "error": str(e)})
 
 @graph_bp.route('/expand_node', methods=['POST'])
 def expand_node_api():
-    global global_data
-    
     data = request.json
+    topic = request_topic(data)
     node_id = data.get('node_id')
     calculate_similarity = data.get('calculate_similarity', False)
+    # "force" asks Claude again instead of reusing a cached expansion.
+    use_cache = not data.get('force', False)
     
     if not node_id:
         return jsonify({"success": False, "error": "No node ID provided"})
     
-    if global_data is None:
+    planning_graph = snapshot_graph(topic)
+    if planning_graph is None:
         return jsonify({"success": False, "error": "No graph data loaded"})
     
     try:
-        updated_data, success, new_nodes, error = expand_node(global_data, node_id, calculate_similarity)
+        generated_nodes, error = generate_expansion(planning_graph, node_id, use_cache)
+        if error:
+            return jsonify({"success": False, "error": error})
         
-        if success:
-            global_data = updated_data
-            return jsonify({
-                "success": True,
-                "graph_data": prepare_d3_data(global_data, using_similarities=calculate_similarity),
-                "new_nodes": new_nodes,
-                "added_count": len(new_nodes)
-            })
-        else:
-            return jsonify({"success": False, "error": error or "Failed to expand node"})
+        with writing_graph(topic, data) as graph:
+            graph, success, new_nodes, error = apply_expansion(graph, node_id, generated_nodes, calculate_similarity)
+            
+            if success:
+                return jsonify({
+                    "success": True,
+                    **graph_payload(graph, data, calculate_similarity),
+                    "new_nodes": new_nodes,
+                    "added_count": len(new_nodes)
+                })
+            else:
+                return jsonify({"success": False, "error": error or "Failed to expand node"})
+    except GraphConflictError:
+        return conflict_response(topic, data, calculate_similarity)
     except Exception as e:
         print(f"Error in expand_node_api: {e}")
         return jsonify({"success": False, "error": str(e)})
 
 @graph_bp.route('/delete_concept', methods=['POST'])
 def delete_concept_api():
-    global global_data
-    
     data = request.json
+    topic = request_topic(data)
     concept_id = data.get('concept_id')
     use_similarities = data.get('use_similarities', False)
     
     if not concept_id:
         return jsonify({"success": False, "error": "No concept provided"})
     
-    if global_data is None:
-        return jsonify({"success": False, "error": "No graph data loaded"})
-    
     try:
-        updated_data, success = delete_concept(global_data, concept_id)
-        
-        if success:
-            global_data = updated_data
-            return jsonify({
-                "success": True, 
-                "graph_data": prepare_d3_data(global_data, using_similarities=use_similarities)
-            })
-        else:
-            return jsonify({"success": False, "error": "Concept not found"})
+        with writing_graph(topic, data) as graph:
+            if graph is None:
+                return jsonify({"success": False, "error": "No graph data loaded"})
+            
+            graph, success = delete_concept(graph, concept_id)
+            
+            if success:
+                return jsonify({
+                    "success": True,
+                    **graph_payload(graph, data, use_similarities)
+                })
+            else:
+                return jsonify({"success": False, "error": "Concept not found"})
+    except GraphConflictError:
+        return conflict_response(topic, data, use_similarities)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
 @graph_bp.route('/rename_concept', methods=['POST'])
 def rename_concept_api():
-    global global_data
-    
     data = request.json
+    topic = request_topic(data)
     old_id = data.get('old_id')
     new_id = data.get('new_id')
     use_similarities = data.get('use_similarities', False)
@@ -195,28 +570,29 @@ def rename_concept_api():
     if not old_id or not new_id:
         return jsonify({"success": False, "error": "Missing concept identifiers"})
     
-    if global_data is None:
-        return jsonify({"success": False, "error": "No graph data loaded"})
-    
     try:
-        updated_data, success = rename_concept(global_data, old_id, new_id)
-        
-        if success:
-            global_data = updated_data
-            return jsonify({
-                "success": True, 
-                "graph_data": prepare_d3_data(global_data, using_similarities=use_similarities)
-            })
-        else:
-            return jsonify({"success": False, "error": "Concept not found or new name already exists"})
+        with writing_graph(topic, data) as graph:
+            if graph is None:
+                return jsonify({"success": False, "error": "No graph data loaded"})
+            
+            graph, success = rename_concept(graph, old_id, new_id)
+            
+            if success:
+                return jsonify({
+                    "success": True,
+                    **graph_payload(graph, data, use_similarities)
+                })
+            else:
+                return jsonify({"success": False, "error": "Concept not found or new name already exists"})
+    except GraphConflictError:
+        return conflict_response(topic, data, use_similarities)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
 @graph_bp.route('/insert_node', methods=['POST'])
 def insert_node_api():
-    global global_data
-    
     data = request.json
+    topic = request_topic(data)
     parent_id = data.get('parent_id')
     child_id = data.get('child_id')
     new_concept = data.get('new_concept')
@@ -225,21 +601,21 @@ def insert_node_api():
     if not parent_id or not child_id or not new_concept:
         return jsonify({"success": False, "error": "Missing required parameters"})
     
-    if global_data is None:
-        return jsonify({"success": False, "error": "No graph data loaded"})
-    
     try:
-        updated_data, success = insert_node_between(global_data, parent_id, child_id, new_concept, calculate_similarity)
-        
-        if success:
-            global_data = updated_data
-            return jsonify({
-                "success": True, 
-                "graph_data": prepare_d3_data(global_data, using_similarities=calculate_similarity)
-            })
-        else:
-            return jsonify({"success": False, "error": "Failed to insert node"})
+        with writing_graph(topic, data) as graph:
+            if graph is None:
+                return jsonify({"success": False, "error": "No graph data loaded"})
+            
+            graph, success = insert_node_between(graph, parent_id, child_id, new_concept, calculate_similarity)
+            
+            if success:
+                return jsonify({
+                    "success": True,
+                    **graph_payload(graph, data, calculate_similarity)
+                })
+            else:
+                return jsonify({"success": False, "error": "Failed to insert node"})
+    except GraphConflictError:
+        return conflict_response(topic, data, calculate_similarity)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
-
-load_embedding_model()
@@ -0,0 +1,174 @@
+import logging
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from config import Config
+from modules.graph.store import graph_store
+
+logger = logging.getLogger(__name__)
+
+
+class GraphSnapshot:
+    """Read-only view of one graph version with lookups built on first use."""
+
+    def __init__(self, graph, version):
+        self.topic = graph.core
+        self.version = version
+        self.graph = graph
+
+    @cached_property
+    def terms(self):
+        return list(self.graph.ids())
+
+    @cached_property
+    def by_level(self):
+        by_level = {}
+        for concept_id, level, _, _ in self.graph.rows():
+            by_level.setdefault(level, []).append(concept_id)
+        return by_level
+
+    @cached_property
+    def by_parent(self):
+        return self.graph.children
+
+    @cached_property
+    def categories(self):
+        return [term for term in self.terms if term in self.by_parent]
+
+    @cached_property
+    def _by_lower(self):
+        by_lower = {}
+        for term in self.terms:
+            by_lower.setdefault(term.lower(), term)
+        return by_lower
+
+    def find(self, term):
+        concept_id = self._by_lower.get(term.lower())
+        return self.graph.get(concept_id) if concept_id is not None else None
+
+    def terms_at_level(self, level):
+        return self.by_level.get(level, [])
+
+    def children_of(self, parent):
+        return self.by_parent.get(parent, [])
+
+    def descendants_of(self, parent):
+        return self.graph.descendants(parent)
+
+    def ancestors_of(self, term):
+        return self.graph.ancestors(term)
+
+
+class GraphSnapshotProvider:
+    """Process-wide cache of parsed graph snapshots, one per topic.
+
+    A snapshot is rebuilt only when the store's version counter for the
+    topic moves, or, for file-backed stores, when the files' mtime/size
+    change underneath us (e.g. another process wrote them). Writers in
+    this process hand their committed graph to ``update``, which only
+    notes the ops committed since the topic's snapshot; the next read
+    replays them onto a copy of that snapshot instead of reloading, so
+    neither the edit nor the read costs a full load.
+    """
+
+    def __init__(self, store=None, max_topics=None):
+        self.store = store or graph_store
+        self.max_topics = max_topics or Config.GRAPH_SNAPSHOT_MAX_TOPICS
+        self.hits = 0
+        self.misses = 0
+        self.replays = 0
+        self._snapshots = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, topic=None):
+        fingerprint = self.store.fingerprint()
+        topic = topic or self.store.active_topic()
+        if topic is None:
+            return None
+
+        key = (self.store.version(topic), fingerprint)
+
+        with self._lock:
+            cached = self._snapshots.get(topic)
+            if cached is not None and cached[0] == key:
+                self._snapshots.move_to_end(topic)
+                self.hits += 1
+                return cached[1]
+            pending = self._pending.get(topic)
+
+        snapshot = None
+        if pending is not None and pending[0] == key:
+            snapshot = self._replay(*pending[1:])
+        if snapshot is None:
+            graph = self.store.load(topic)
+            if graph is None:
+                return None
+            snapshot = GraphSnapshot(graph, key[0])
+            with self._lock:
+                self.misses += 1
+            logger.debug(f"Parsed graph snapshot for '{topic}' at version {key[0]}")
+        else:
+            with self._lock:
+                self.replays += 1
+
+        with self._lock:
+            self._put(topic, key, snapshot)
+        return snapshot
+
+    def update(self, graph, create=False):
+        """Note the ops ``graph`` has committed since the topic's snapshot. The
+        caller holds the topic's write lock. A topic without a snapshot is
+        skipped, or, with ``create``, gets one copied from ``graph``."""
+        topic = graph.core
+        key = (graph.version, self.store.fingerprint())
+        with self._lock:
+            cached = self._snapshots.get(topic)
+        if cached is None:
+            if not create:
+                return None
+            snapshot = GraphSnapshot(graph.copy(), graph.version)
+            with self._lock:
+                self._put(topic, key, snapshot)
+            return snapshot
+        base = cached[1]
+        if base.version == graph.version:
+            return base
+
+        entries = [(version, ops) for version, ops in graph.history if version > base.version]
+        with self._lock:
+            if len(entries) == graph.version - base.version:
+                self._pending[topic] = (key, base, entries)
+            else:
+                # The history no longer reaches the snapshot; the next read reloads.
+                self._pending.pop(topic, None)
+        return self.get(topic) if create else None
+
+    def _replay(self, base, entries):
+        graph = base.graph.copy()
+        try:
+            for version, ops in entries:
+                for op in ops:
+                    graph.apply(op)
+                graph.take_changes()
+                graph.mark_committed(version, ops)
+        except Exception as e:
+            logger.warning(f"Replaying edits onto the '{base.topic}' snapshot failed: {e}")
+            return None
+        return GraphSnapshot(graph, graph.version)
+
+    def _put(self, topic, key, snapshot):
+        self._snapshots[topic] = (key, snapshot)
+        self._snapshots.move_to_end(topic)
+        pending = self._pending.get(topic)
+        if pending is not None and pending[0][0] <= snapshot.version:
+            del self._pending[topic]
+        while len(self._snapshots) > self.max_topics:
+            evicted, _ = self._snapshots.popitem(last=False)
+            self._pending.pop(evicted, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "replays": self.replays, "topics": list(self._snapshots)}
+
+
+graph_snapshots = GraphSnapshotProvider()
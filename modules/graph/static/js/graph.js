@@ -1,17 +1,26 @@
 const App = {
     state: {
         graphData: {nodes: [], links: []},
+        version: null,
         currentTopic: "Machine Learning",
         nodePositions: {},
         contextNode: null,
         contextLink: null,
-        similaritiesEnabled: false
+        similaritiesEnabled: false,
+        maxDepth: 3,
+        pageSize: 50,
+        embeddingsPoll: null,
+        relatedEnabled: false,
+        relatedLinks: [],
+        relatedPoll: null,
+        generation: null
     },
     
     elements: {
         svg: null,
         simulation: null,
         link: null,
+        relatedLink: null,
         node: null,
         labels: null,
         zoom: null,
@@ -62,6 +71,11 @@ const App = {
             this.loadGraphData(this.state.currentTopic);
         });
         
+        document.getElementById('related-checkbox').addEventListener('change', (e) => {
+            this.state.relatedEnabled = e.target.checked;
+            this.loadRelatedLinks();
+        });
+        
         document.getElementById('zoom-in').addEventListener('click', () => {
             this.elements.svg.transition().call(this.elements.zoom.scaleBy, 1.3);
         });
@@ -113,18 +127,33 @@ const App = {
     
     loadGraphData(topic, forceRegenerate = false) {
         this.UI.showLoading();
+        this.stopGeneration();
         
-        fetch(`/get_graph_data?topic=${encodeURIComponent(topic)}&force=${forceRegenerate}&use_similarities=${this.state.similaritiesEnabled}`)
+        fetch(`/get_graph_data?topic=${encodeURIComponent(topic)}&force=${forceRegenerate}&use_similarities=${this.state.similaritiesEnabled}` +
+              `&max_depth=${this.state.maxDepth}&max_children=${this.state.pageSize}&related=${this.state.relatedEnabled}&stream=true`)
             .then(response => response.json())
             .then(data => {
+                if (data.generating) {
+                    this.streamGraph(data.topic, forceRegenerate);
+                    return;
+                }
                 this.state.currentTopic = data.topic;
                 this.state.graphData = data.graph_data;
+                this.state.version = data.version;
+                this.state.relatedLinks = data.graph_data.related_links || [];
                 
                 document.title = `Knowledge Graph: ${this.state.currentTopic}`;
                 document.getElementById('topic-input').value = this.state.currentTopic;
                 
                 this.initializeGraph();
                 this.UI.hideLoading();
+                
+                if (data.similarities_pending) {
+                    this.reloadWhenEmbeddingsReady(data.topic);
+                }
+                if (data.related_pending) {
+                    this.state.relatedPoll = setTimeout(() => this.loadRelatedLinks(), 5000);
+                }
             })
             .catch(error => {
                 console.error('Error loading graph data:', error);
@@ -133,6 +162,111 @@ const App = {
             });
     },
     
+    streamGraph(topic, forceRegenerate) {
+        // New topics arrive level by level: the root and its children first,
+        // then one delta per expanded concept.
+        const source = new EventSource(`/generate_stream?topic=${encodeURIComponent(topic)}&force=${forceRegenerate}` +
+                                       `&max_depth=${this.state.maxDepth}&max_children=${this.state.pageSize}`);
+        this.state.generation = source;
+        let received = false;
+        
+        source.addEventListener('graph', event => {
+            const data = JSON.parse(event.data);
+            received = true;
+            this.state.currentTopic = data.topic;
+            this.state.graphData = data.graph_data;
+            this.state.version = data.version;
+            this.state.relatedLinks = [];
+            
+            document.title = `Knowledge Graph: ${this.state.currentTopic}`;
+            document.getElementById('topic-input').value = this.state.currentTopic;
+            
+            this.initializeGraph();
+            this.UI.hideLoading();
+        });
+        
+        source.addEventListener('delta', event => {
+            const data = JSON.parse(event.data);
+            this.applyDelta(data.delta);
+            this.state.version = data.version;
+        });
+        
+        source.addEventListener('done', event => {
+            this.state.version = JSON.parse(event.data).version;
+            this.stopGeneration();
+            if (this.state.relatedEnabled) {
+                this.loadRelatedLinks();
+            }
+        });
+        
+        source.addEventListener('error', event => {
+            // Either an error event from the server or a dropped connection;
+            // don't let EventSource reconnect and start generating again.
+            console.error('Error generating graph:', event.data || 'connection lost');
+            this.stopGeneration();
+            this.UI.hideLoading();
+            if (!received) {
+                alert('Failed to generate the graph. Please try again.');
+            }
+        });
+    },
+    
+    stopGeneration() {
+        if (this.state.generation) {
+            this.state.generation.close();
+            this.state.generation = null;
+        }
+    },
+    
+    reloadWhenEmbeddingsReady(topic) {
+        // The embedding model is still loading on the server: poll until it
+        // is ready, then reload once so the similarities get filled in.
+        clearTimeout(this.state.embeddingsPoll);
+        this.state.embeddingsPoll = setTimeout(() => {
+            fetch('/health/ready')
+                .then(response => response.json())
+                .then(status => {
+                    if (status.ready) {
+                        if (this.state.currentTopic === topic && this.state.similaritiesEnabled) {
+                            this.loadGraphData(topic);
+                        }
+                    } else if (status.state !== 'failed') {
+                        this.reloadWhenEmbeddingsReady(topic);
+                    }
+                })
+                .catch(() => this.reloadWhenEmbeddingsReady(topic));
+        }, 5000);
+    },
+    
+    loadRelatedLinks() {
+        clearTimeout(this.state.relatedPoll);
+        if (!this.state.relatedEnabled) {
+            this.state.relatedLinks = [];
+            this.drawRelatedLinks();
+            return;
+        }
+        
+        fetch('/related_links', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                core_topic: this.state.currentTopic,
+                ids: this.state.graphData.nodes.map(n => n.id)
+            })
+        })
+        .then(response => response.json())
+        .then(data => {
+            this.state.relatedLinks = data.related_links;
+            this.drawRelatedLinks();
+            
+            // Refreshed in the background after edits; poll until it catches up.
+            if (data.pending) {
+                this.state.relatedPoll = setTimeout(() => this.loadRelatedLinks(), 5000);
+            }
+        })
+        .catch(error => console.error('Error loading related links:', error));
+    },
+    
     changeTopic() {
         const newTopic = document.getElementById('topic-input').value.trim();
         
@@ -164,21 +298,32 @@ const App = {
             body: JSON.stringify({
                 term: newTerm,
                 core_topic: this.state.currentTopic,
+                client_version: this.state.version,
+                base_version: this.state.version,
+                max_depth: this.state.maxDepth,
+                max_children: this.state.pageSize,
                 calculate_similarity: this.state.similaritiesEnabled
             })
         })
-        .then(response => response.json())
+        .then(response => this.readGraphResponse(response))
         .then(data => {
             this.UI.hideLoading();
             
             if (data.success) {
                 document.getElementById('new-term-input').value = '';
                 
-                this.state.graphData = data.graph_data;
-                this.initializeGraph();
+                this.applyGraphResponse(data);
+                
+                const placedBy = {
+                    'embedding': 'by similarity',
+                    'llm-candidates': 'by Claude from the closest matches',
+                    'embedding-after-llm-failure': 'by similarity',
+                    'llm': 'by Claude'
+                }[data.placement && data.placement.path];
                 
                 statusEl.querySelector('.status-text').innerHTML = 
-                    `Added "<strong>${newTerm}</strong>" as a child of "<strong>${data.parent_node}</strong>" (Level ${data.level})`;
+                    `Added "<strong>${newTerm}</strong>" as a child of "<strong>${data.parent_node}</strong>" (Level ${data.level})` +
+                    (placedBy ? `, placed ${placedBy}` : '');
                     
                 this.highlightNodes([newTerm, data.parent_node]);
             } else {
@@ -207,16 +352,19 @@ const App = {
             body: JSON.stringify({
                 node_id: nodeId,
                 core_topic: this.state.currentTopic,
+                client_version: this.state.version,
+                base_version: this.state.version,
+                max_depth: this.state.maxDepth,
+                max_children: this.state.pageSize,
                 calculate_similarity: this.state.similaritiesEnabled
             })
         })
-        .then(response => response.json())
+        .then(response => this.readGraphResponse(response))
         .then(data => {
             this.UI.hideLoading();
             
             if (data.success) {
-                this.state.graphData = data.graph_data;
-                this.initializeGraph();
+                this.applyGraphResponse(data);
                 
                 if (statusEl) {
                     statusEl.querySelector('.status-text').innerHTML = 
@@ -248,6 +396,136 @@ const App = {
         });
     },
     
+    loadChildren(node) {
+        const params = new URLSearchParams({
+            topic: this.state.currentTopic,
+            cursor: node.next_cursor || '',
+            limit: this.state.pageSize,
+            use_similarities: this.state.similaritiesEnabled
+        });
+        
+        fetch(`/children/${encodeURIComponent(node.id)}?${params}`)
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    alert('Error loading children: ' + data.error);
+                    return;
+                }
+                
+                node.child_count = data.child_count;
+                node.hidden_children = data.remaining;
+                node.next_cursor = data.next_cursor;
+                this.applyDelta({removed: [], renamed: [], nodes: data.nodes, links: data.links});
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                alert('An error occurred while loading child nodes.');
+            });
+    },
+    
+    labelText(d) {
+        return d.hidden_children > 0 ? `${d.id} (+${d.hidden_children})` : d.id;
+    },
+    
+    readGraphResponse(response) {
+        return response.json().then(data => {
+            if (data.conflict && (data.delta || data.graph_data)) {
+                this.applyGraphResponse(data);
+            }
+            return data;
+        });
+    },
+    
+    applyGraphResponse(data) {
+        if (data.delta && this.elements.simulation) {
+            this.applyDelta(data.delta);
+        } else {
+            this.state.graphData = data.graph_data;
+            this.initializeGraph();
+        }
+        this.state.version = data.version;
+    },
+    
+    endpointId(end) {
+        return typeof end === 'object' ? end.id : end;
+    },
+    
+    applyDelta(delta) {
+        const nodeById = new Map(this.state.graphData.nodes.map(n => [n.id, n]));
+        let nodes = this.state.graphData.nodes;
+        let links = this.state.graphData.links;
+        
+        const removed = new Set(delta.removed);
+        if (removed.size > 0) {
+            nodes = nodes.filter(n => !removed.has(n.id));
+            links = links.filter(l => !removed.has(this.endpointId(l.source)) && !removed.has(this.endpointId(l.target)));
+            removed.forEach(id => nodeById.delete(id));
+        }
+        
+        const renamed = delta.renamed.map(([oldId, newId]) => {
+            const node = nodeById.get(oldId);
+            nodeById.delete(oldId);
+            return [node, newId];
+        });
+        renamed.forEach(([node, newId]) => {
+            if (!node) return;
+            node.id = newId;
+            nodeById.set(newId, node);
+        });
+        
+        const parentOf = new Map(delta.links.map(l => [l.target, l.source]));
+        delta.nodes.forEach(n => {
+            const existing = nodeById.get(n.id);
+            if (existing) {
+                existing.level = n.level;
+                existing.group = n.group;
+                return;
+            }
+            const parent = nodeById.get(parentOf.get(n.id));
+            if (parentOf.has(n.id) && !parent) {
+                // Parent is collapsed on this client; it shows up when expanded.
+                return;
+            }
+            if (!this.placeFromServer(n) && parent) {
+                n.x = parent.x + (Math.random() - 0.5) * 60;
+                n.y = parent.y + (Math.random() - 0.5) * 60;
+            }
+            nodes.push(n);
+            nodeById.set(n.id, n);
+        });
+        
+        const updated = new Set(delta.nodes.map(n => n.id));
+        links = links.filter(l => !updated.has(this.endpointId(l.target)));
+        delta.links.forEach(l => {
+            if (!nodeById.has(l.source) || !nodeById.has(l.target)) return;
+            links.push(Object.assign({}, l, {
+                source: nodeById.get(l.source),
+                target: nodeById.get(l.target)
+            }));
+        });
+        links.forEach(l => {
+            l.key = `${this.endpointId(l.source)}->${this.endpointId(l.target)}`;
+        });
+        
+        this.state.graphData.nodes = nodes;
+        this.state.graphData.links = links;
+        this.refreshGraph();
+        
+        if (this.state.relatedEnabled) {
+            this.loadRelatedLinks();
+        }
+    },
+    
+    refreshGraph() {
+        const g = this.elements.svg.select('#zoom-group');
+        
+        this.setupColorScale();
+        this.elements.simulation.nodes(this.state.graphData.nodes);
+        this.elements.simulation.force('link').links(this.state.graphData.links);
+        this.createVisualElements(g);
+        this.elements.simulation.alpha(0.3).restart();
+    },
+    
     highlightNodes(nodeIds) {
         if (!this.elements.node) return;
         
@@ -275,12 +553,13 @@ const App = {
         g.selectAll("*").remove();
         
         this.setupColorScale();
-        this.setupNodePositions();
+        const serverLayout = this.setupNodePositions();
         this.setupForceSimulation();
         this.createVisualElements(g);
         
         if (this.elements.simulation) {
-            this.elements.simulation.alpha(1).restart();
+            // A server layout is already close to equilibrium.
+            this.elements.simulation.alpha(serverLayout ? 0.3 : 1).restart();
         }
         
         setTimeout(() => {
@@ -316,8 +595,11 @@ const App = {
         }
         
         const nodesByLevel = {};
+        let serverLayout = true;
         this.state.graphData.nodes.forEach(node => {
             if (node.level === 0) return;
+            if (this.placeFromServer(node)) return;
+            serverLayout = false;
             
             if (!nodesByLevel[node.level]) {
                 nodesByLevel[node.level] = [];
@@ -337,6 +619,18 @@ const App = {
                 node.y = centerY + radius * Math.sin(angle);
             });
         });
+        
+        return serverLayout;
+    },
+    
+    placeFromServer(node) {
+        // The server lays concepts out around (0, 0); shift them to the centre once.
+        if (node.placed) return true;
+        if (typeof node.x !== 'number' || typeof node.y !== 'number') return false;
+        node.x += this.elements.width / 2;
+        node.y += this.elements.height / 2;
+        node.placed = true;
+        return true;
     },
     
     setupForceSimulation() {
@@ -393,6 +687,14 @@ const App = {
             .attr('x2', d => d.target.x)
             .attr('y2', d => d.target.y);
         
+        if (this.elements.relatedLink) {
+            this.elements.relatedLink
+                .attr('x1', d => d.source.x)
+                .attr('y1', d => d.source.y)
+                .attr('x2', d => d.target.x)
+                .attr('y2', d => d.target.y);
+        }
+        
         const padding = 20;
         this.elements.node
             .attr('cx', d => d.x = Math.max(padding, Math.min(this.elements.width - padding, d.x)))
@@ -401,12 +703,54 @@ const App = {
         this.elements.labels.attr('transform', d => `translate(${d.x},${d.y})`);
     },
     
+    layer(g, className) {
+        const existing = g.select(`g.${className}`);
+        return existing.empty() ? g.append('g').attr('class', className) : existing;
+    },
+    
+    drawRelatedLinks() {
+        const g = this.elements.svg.select('#zoom-group');
+        const nodeById = new Map(this.state.graphData.nodes.map(n => [n.id, n]));
+        const links = this.state.relatedLinks
+            .filter(l => nodeById.has(this.endpointId(l.source)) && nodeById.has(this.endpointId(l.target)))
+            .map(l => Object.assign({}, l, {
+                source: nodeById.get(this.endpointId(l.source)),
+                target: nodeById.get(this.endpointId(l.target))
+            }));
+        
+        this.elements.relatedLink = this.layer(g, 'related-links')
+            .selectAll('line')
+            .data(links, d => d.key)
+            .join(enter => enter.append('line')
+                .call(line => line.append('title')))
+            .attr('stroke', '#8e44ad')
+            .attr('stroke-width', 1.5)
+            .style('stroke-dasharray', '2,4')
+            .style('stroke-opacity', d => 0.2 + d.similarity * 0.5)
+            .attr('x1', d => d.source.x)
+            .attr('y1', d => d.source.y)
+            .attr('x2', d => d.target.x)
+            .attr('y2', d => d.target.y);
+        
+        this.elements.relatedLink.select('title')
+            .text(d => `Related: ${d.source.id} ~ ${d.target.id} (${(d.similarity * 100).toFixed(1)}%)`);
+    },
+    
     createVisualElements(g) {
-        this.elements.link = g.append('g')
-            .attr('class', 'links')
+        // Created first so related links are drawn beneath the tree.
+        this.layer(g, 'related-links');
+        this.drawRelatedLinks();
+        
+        this.elements.link = this.layer(g, 'links')
             .selectAll('line')
-            .data(this.state.graphData.links)
-            .enter().append('line')
+            .data(this.state.graphData.links, d => this.endpointId(d.target))
+            .join(enter => enter.append('line')
+                .on('contextmenu', (event, d) => {
+                    event.preventDefault();
+                    this.state.contextNode = null;
+                    this.state.contextLink = d;
+                    this.UI.showLinkContextMenu(event.pageX, event.pageY, d);
+                }))
             .attr('stroke-width', d => {
                 if (this.state.similaritiesEnabled && d.similarity !== null) {
                     return 1 + (d.similarity * 3);
@@ -423,75 +767,73 @@ const App = {
                 }
             });
             
-        this.elements.node = g.append('g')
-            .attr('class', 'nodes')
+        this.elements.node = this.layer(g, 'nodes')
             .selectAll('circle')
-            .data(this.state.graphData.nodes)
-            .enter().append('circle')
+            .data(this.state.graphData.nodes, d => d.id)
+            .join(enter => enter.append('circle')
+                .attr('cx', d => d.x)
+                .attr('cy', d => d.y)
+                .call(d3.drag()
+                    .on('start', (event, d) => this.dragStarted(event, d))
+                    .on('drag', (event, d) => this.dragged(event, d))
+                    .on('end', (event, d) => this.dragEnded(event, d)))
+                .on('click', (event, d) => {
+                    event.stopPropagation();
+                    this.showNodeInfo(d);
+                    
+                    if (d.hidden_children > 0) {
+                        this.loadChildren(d);
+                    }
+                    
+                    if (d.level === 0) {
+                        this.recenterGraph();
+                    }
+                })
+                .on('contextmenu', (event, d) => {
+                    event.preventDefault();
+                    this.state.contextNode = d;
+                    this.state.contextLink = null;
+                    this.UI.showNodeContextMenu(event.pageX, event.pageY, d);
+                })
+                .call(circle => circle.append('title')))
             .attr('r', d => d.level === 0 ? 25 : 20 - (d.level * 1.5))
-            .attr('fill', d => this.colorScale(d.level))
-            .attr('cx', d => d.x)
-            .attr('cy', d => d.y)
-            .call(d3.drag()
-                .on('start', (event, d) => this.dragStarted(event, d))
-                .on('drag', (event, d) => this.dragged(event, d))
-                .on('end', (event, d) => this.dragEnded(event, d)));
-                
-        this.elements.node
-            .on('click', (event, d) => {
-                event.stopPropagation();
-                this.showNodeInfo(d);
-                
-                if (d.level === 0) {
-                    this.recenterGraph();
-                }
-            })
-            .on('contextmenu', (event, d) => {
-                event.preventDefault();
-                this.state.contextNode = d;
-                this.state.contextLink = null;
-                this.UI.showNodeContextMenu(event.pageX, event.pageY, d);
-            });
+            .attr('fill', d => this.colorScale(d.level));
             
-        this.elements.link.on('contextmenu', (event, d) => {
-            event.preventDefault();
-            this.state.contextNode = null;
-            this.state.contextLink = d;
-            this.UI.showLinkContextMenu(event.pageX, event.pageY, d);
-        });
+        this.elements.node.select('title')
+            .text(d => `${d.id}\nLevel: ${d.level}` +
+                (d.hidden_children > 0 ? `\n${d.hidden_children} more children (click to load)` : ''));
             
-        const labelGroup = g.append('g')
-            .attr('class', 'node-labels')
+        const labelGroup = this.layer(g, 'node-labels')
             .selectAll('g')
-            .data(this.state.graphData.nodes)
-            .enter()
-            .append('g');
-            
-        labelGroup.append('rect')
-            .attr('fill', 'white')
-            .attr('fill-opacity', 0.7)
-            .attr('rx', 3)
-            .attr('ry', 3);
-            
-        const textLabels = labelGroup.append('text')
-            .attr('dx', 15)
-            .attr('dy', '.35em')
-            .text(d => d.id);
-            
-        labelGroup.each(function() {
-            const bbox = this.getElementsByTagName('text')[0].getBBox();
-            const rect = this.getElementsByTagName('rect')[0];
-            d3.select(rect)
-                .attr('x', bbox.x - 2)
-                .attr('y', bbox.y - 2)
-                .attr('width', bbox.width + 4)
-                .attr('height', bbox.height + 4);
-        });
+            .data(this.state.graphData.nodes, d => d.id)
+            .join(enter => {
+                const group = enter.append('g');
+                group.append('rect')
+                    .attr('fill', 'white')
+                    .attr('fill-opacity', 0.7)
+                    .attr('rx', 3)
+                    .attr('ry', 3);
+                group.append('text')
+                    .attr('dx', 15)
+                    .attr('dy', '.35em');
+                return group;
+            });
+            
+        const labelText = d => this.labelText(d);
+        labelGroup.filter(function(d) { return this.dataset.label !== labelText(d); })
+            .each(function(d) {
+                this.dataset.label = labelText(d);
+                const text = this.getElementsByTagName('text')[0];
+                text.textContent = this.dataset.label;
+                const bbox = text.getBBox();
+                d3.select(this.getElementsByTagName('rect')[0])
+                    .attr('x', bbox.x - 2)
+                    .attr('y', bbox.y - 2)
+                    .attr('width', bbox.width + 4)
+                    .attr('height', bbox.height + 4);
+            });
         
         this.elements.labels = labelGroup;
-            
-        this.elements.node.append('title')
-            .text(d => `${d.id}\nLevel: ${d.level}`);
     },
     
     recenterGraph() {
@@ -577,16 +919,20 @@ const App = {
                 body: JSON.stringify({ 
                     old_id: oldId, 
                     new_id: newId,
+                    core_topic: App.state.currentTopic,
+                    client_version: App.state.version,
+                    base_version: App.state.version,
+                    max_depth: App.state.maxDepth,
+                    max_children: App.state.pageSize,
                     use_similarities: App.state.similaritiesEnabled
                 })
             })
-            .then(response => response.json())
+            .then(response => App.readGraphResponse(response))
             .then(data => {
                 App.UI.hideLoading();
                 
                 if (data.success) {
-                    App.state.graphData = data.graph_data;
-                    App.initializeGraph();
+                    App.applyGraphResponse(data);
                 } else {
                     alert('Error renaming node: ' + data.error);
                 }
@@ -609,16 +955,19 @@ const App = {
                     parent: parentId,
                     level: level,
                     core_topic: App.state.currentTopic,
+                    client_version: App.state.version,
+                    base_version: App.state.version,
+                    max_depth: App.state.maxDepth,
+                    max_children: App.state.pageSize,
                     calculate_similarity: App.state.similaritiesEnabled
                 })
             })
-            .then(response => response.json())
+            .then(response => App.readGraphResponse(response))
             .then(data => {
                 App.UI.hideLoading();
                 
                 if (data.success) {
-                    App.state.graphData = data.graph_data;
-                    App.initializeGraph();
+                    App.applyGraphResponse(data);
                 } else {
                     alert('Error adding child node: ' + data.error);
                 }
@@ -640,16 +989,20 @@ const App = {
                     parent_id: parentId,
                     child_id: childId,
                     new_concept: newNodeId,
+                    core_topic: App.state.currentTopic,
+                    client_version: App.state.version,
+                    base_version: App.state.version,
+                    max_depth: App.state.maxDepth,
+                    max_children: App.state.pageSize,
                     calculate_similarity: App.state.similaritiesEnabled
                 })
             })
-            .then(response => response.json())
+            .then(response => App.readGraphResponse(response))
             .then(data => {
                 App.UI.hideLoading();
                 
                 if (data.success) {
-                    App.state.graphData = data.graph_data;
-                    App.initializeGraph();
+                    App.applyGraphResponse(data);
                 } else {
                     alert('Error inserting node: ' + data.error);
                 }
@@ -669,16 +1022,20 @@ const App = {
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ 
                     concept_id: nodeId,
+                    core_topic: App.state.currentTopic,
+                    client_version: App.state.version,
+                    base_version: App.state.version,
+                    max_depth: App.state.maxDepth,
+                    max_children: App.state.pageSize,
                     use_similarities: App.state.similaritiesEnabled 
                 })
             })
-            .then(response => response.json())
+            .then(response => App.readGraphResponse(response))
             .then(data => {
                 App.UI.hideLoading();
                 
                 if (data.success) {
-                    App.state.graphData = data.graph_data;
-                    App.initializeGraph();
+                    App.applyGraphResponse(data);
                 } else {
                     alert('Error deleting node: ' + data.error);
                 }
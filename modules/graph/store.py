@@ -0,0 +1,349 @@
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from config import Config
+from modules.graph.concept_graph import ConceptGraph
+from modules.graph.journal import GraphJournal
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topics (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS concepts (
+    topic TEXT NOT NULL,
+    id TEXT NOT NULL,
+    parent TEXT,
+    level INTEGER,
+    extra TEXT,
+    UNIQUE (topic, id)
+);
+CREATE INDEX IF NOT EXISTS idx_concepts_parent ON concepts (topic, parent);
+CREATE INDEX IF NOT EXISTS idx_concepts_level ON concepts (topic, level);
+CREATE INDEX IF NOT EXISTS idx_concepts_nocase ON concepts (topic, id COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS relationships (
+    topic TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    value REAL,
+    UNIQUE (topic, source, target)
+);
+CREATE INDEX IF NOT EXISTS idx_relationships_source ON relationships (topic, source);
+CREATE INDEX IF NOT EXISTS idx_relationships_target ON relationships (topic, target);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+CONCEPT_FIELDS = ("id", "level", "parent")
+
+
+class GraphConflictError(Exception):
+    """A write was based on an older version of the topic than the store holds."""
+
+    def __init__(self, topic, base_version, current_version):
+        super().__init__(f"Graph '{topic}' is at version {current_version}, not {base_version}")
+        self.topic = topic
+        self.base_version = base_version
+        self.current_version = current_version
+
+
+class SQLiteGraphStore:
+    """Multi-topic graph store on sqlite3 in WAL mode.
+
+    Concepts keep their insertion order through the table rowid, and any
+    extra concept keys are kept as JSON in ``extra`` so graphs round-trip
+    losslessly. ``commit`` turns a graph's recorded ops into row-level
+    statements, so an edit only touches the rows it affects.
+
+    Commits are a compare-and-swap on the topic's version inside a
+    ``BEGIN IMMEDIATE`` transaction, so several worker processes can share
+    one database: a graph whose version is behind the row raises
+    GraphConflictError and nothing is written.
+    """
+
+    def __init__(self, db_file=None):
+        self.db_file = Path(db_file or Config.GRAPH_DB_FILE)
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            self._migrate(conn)
+            conn.executescript(SCHEMA)
+
+        if not self.topics() and Config.GRAPH_DATA_FILE.exists():
+            try:
+                self.import_json(Config.GRAPH_DATA_FILE)
+            except Exception as e:
+                logger.error(f"Error importing {Config.GRAPH_DATA_FILE}: {str(e)}")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_file.parent.mkdir(exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def topics(self):
+        rows = self._connect().execute("SELECT name FROM topics ORDER BY updated_at DESC").fetchall()
+        return [row[0] for row in rows]
+
+    def version(self, topic):
+        row = self._connect().execute("SELECT version FROM topics WHERE name = ?", (topic,)).fetchone()
+        return row[0] if row else None
+
+    def fingerprint(self):
+        return None
+
+    def active_topic(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'active_topic'").fetchone()
+        if row:
+            return row[0]
+        topics = self.topics()
+        return topics[0] if topics else None
+
+    def set_active_topic(self, topic):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('active_topic', ?)", (topic,))
+
+    def load(self, topic):
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM topics WHERE name = ?", (topic,)).fetchone() is None:
+            return None
+
+        concepts = [
+            self._row_to_concept(row) for row in conn.execute(
+                "SELECT id, parent, level, extra FROM concepts WHERE topic = ? ORDER BY rowid", (topic,))
+        ]
+        relationships = conn.execute(
+            "SELECT source, target, value FROM relationships WHERE topic = ? ORDER BY rowid", (topic,)).fetchall()
+        graph = ConceptGraph(topic, concepts, relationships)
+        graph.reset_history(self.version(topic))
+        return graph
+
+    def save(self, graph):
+        graph.take_changes()
+        topic = graph.core
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM concepts WHERE topic = ?", (topic,))
+            conn.execute("DELETE FROM relationships WHERE topic = ?", (topic,))
+            conn.executemany(
+                "INSERT INTO concepts (topic, id, parent, level, extra) VALUES (?, ?, ?, ?, ?)",
+                [self._concept_to_row(topic, c) for c in graph.concepts])
+            conn.executemany(
+                "INSERT INTO relationships (topic, source, target, value) VALUES (?, ?, ?, ?)",
+                [(topic, source, target, value) for source, target, value in graph.relationship_items()])
+            graph.reset_history(self._bump_version(conn, topic))
+
+    def commit(self, graph):
+        ops = graph.take_changes()
+        if not ops:
+            return
+        topic = graph.core
+        with self._transaction() as conn:
+            row = conn.execute("SELECT version FROM topics WHERE name = ?", (topic,)).fetchone()
+            current_version = row[0] if row else 0
+            if current_version != graph.version:
+                raise GraphConflictError(topic, graph.version, current_version)
+            for op in ops:
+                self._apply_op(conn, topic, op)
+            graph.mark_committed(self._bump_version(conn, topic), ops)
+
+    def import_json(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            graph = ConceptGraph.from_dict(json.load(f))
+        self.save(graph)
+        logger.debug(f"Imported graph '{graph.core}' from {path}")
+        return graph
+
+    def export_json(self, topic, path=None):
+        graph = self.load(topic)
+        if graph is None:
+            return None
+        data = graph.to_dict()
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+        return data
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _apply_op(self, conn, topic, op):
+        kind = op["op"]
+        if kind == "add":
+            conn.execute(
+                "INSERT OR REPLACE INTO concepts (topic, id, parent, level, extra) VALUES (?, ?, ?, ?, ?)",
+                self._concept_to_row(topic, op["concept"]))
+        elif kind == "remove":
+            ids = [(topic, concept_id) for concept_id in op["ids"]]
+            conn.executemany("DELETE FROM concepts WHERE topic = ? AND id = ?", ids)
+            conn.executemany("DELETE FROM relationships WHERE topic = ? AND source = ?", ids)
+            conn.executemany("DELETE FROM relationships WHERE topic = ? AND target = ?", ids)
+        elif kind == "rename":
+            old_id, new_id = op["old"], op["new"]
+            conn.execute("UPDATE concepts SET id = ? WHERE topic = ? AND id = ?", (new_id, topic, old_id))
+            conn.execute("UPDATE concepts SET parent = ? WHERE topic = ? AND parent = ?", (new_id, topic, old_id))
+            conn.execute("UPDATE relationships SET source = ? WHERE topic = ? AND source = ?", (new_id, topic, old_id))
+            conn.execute("UPDATE relationships SET target = ? WHERE topic = ? AND target = ?", (new_id, topic, old_id))
+        elif kind == "set_parent":
+            conn.execute(
+                "UPDATE concepts SET parent = ?, level = COALESCE(?, level) WHERE topic = ? AND id = ?",
+                (op["parent"], op.get("level"), topic, op["id"]))
+        elif kind == "set_rel":
+            conn.execute(
+                "INSERT OR REPLACE INTO relationships (topic, source, target, value) VALUES (?, ?, ?, ?)",
+                (topic, op["source"], op["target"], op["value"]))
+        elif kind == "drop_rel":
+            conn.execute("DELETE FROM relationships WHERE topic = ? AND source = ? AND target = ?",
+                         (topic, op["source"], op["target"]))
+        elif kind == "set_positions":
+            conn.executemany(
+                "UPDATE concepts SET extra = json_set(COALESCE(extra, '{}'), '$.x', ?, '$.y', ?) "
+                "WHERE topic = ? AND id = ?",
+                [(x, y, topic, concept_id) for concept_id, (x, y) in op["positions"].items()])
+        else:
+            raise ValueError(f"Unknown graph op '{kind}'")
+
+    def _migrate(self, conn):
+        # Relationships used to be unique on a "source->target" key, which
+        # two different pairs share when a name contains "->".
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(relationships)")]
+        if "key" not in columns:
+            return
+        conn.executescript("""
+            ALTER TABLE relationships RENAME TO relationships_keyed;
+            DROP INDEX IF EXISTS idx_relationships_source;
+            DROP INDEX IF EXISTS idx_relationships_target;
+        """ + SCHEMA + """
+            INSERT OR IGNORE INTO relationships (topic, source, target, value)
+                SELECT topic, source, target, value FROM relationships_keyed ORDER BY rowid;
+            DROP TABLE relationships_keyed;
+        """)
+        logger.info(f"Migrated relationships in {self.db_file} to (source, target) keys")
+
+    def _bump_version(self, conn, topic):
+        conn.execute(
+            "INSERT INTO topics (name, version) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP",
+            (topic,))
+        return conn.execute("SELECT version FROM topics WHERE name = ?", (topic,)).fetchone()[0]
+
+    def _concept_to_row(self, topic, concept):
+        extra = {k: v for k, v in concept.items() if k not in CONCEPT_FIELDS}
+        return (topic, concept["id"], concept.get("parent"), concept.get("level"),
+                json.dumps(extra) if extra else None)
+
+    def _row_to_concept(self, row):
+        concept_id, parent, level, extra = row
+        concept = {"id": concept_id, "level": level, "parent": parent}
+        if extra:
+            concept.update(json.loads(extra))
+        return concept
+
+
+class JSONGraphStore:
+    """Single-topic store over GRAPH_DATA_FILE and its mutation journal."""
+
+    def __init__(self, journal=None, journaled=True):
+        self.journal = journal or GraphJournal()
+        self.journaled = journaled
+        self._topic = None
+        self._fingerprint = None
+
+    def topics(self):
+        topic = self.active_topic()
+        return [topic] if topic else []
+
+    def version(self, topic):
+        return self.journal.seq if topic == self.active_topic() else None
+
+    def fingerprint(self):
+        fingerprint = tuple(
+            (path.stat().st_mtime_ns, path.stat().st_size) if path.exists() else None
+            for path in (self.journal.snapshot_file, self.journal.journal_file)
+        )
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._topic = None
+        return fingerprint
+
+    def active_topic(self):
+        if self._topic is None:
+            graph = self.journal.read()
+            self._topic = graph.core if graph is not None else None
+        return self._topic
+
+    def set_active_topic(self, topic):
+        pass
+
+    def load(self, topic):
+        graph = self.journal.load()
+        self._topic = graph.core if graph is not None else None
+        if graph is None or graph.core != topic:
+            return None
+        graph.reset_history(self.journal.seq)
+        return graph
+
+    def save(self, graph):
+        graph.take_changes()
+        graph.reset_history(self.journal.write_snapshot(graph))
+        self._topic = graph.core
+
+    def commit(self, graph):
+        ops = graph.take_changes()
+        if not ops:
+            return
+        if graph.version != self.journal.seq:
+            raise GraphConflictError(graph.core, graph.version, self.journal.seq)
+        if self.journaled:
+            version = self.journal.append(ops)
+        else:
+            version = self.journal.write_snapshot(graph)
+        graph.mark_committed(version, ops)
+
+    def import_json(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            graph = ConceptGraph.from_dict(json.load(f))
+        self.save(graph)
+        return graph
+
+    def export_json(self, topic, path=None):
+        graph = self._read(topic)
+        if graph is None:
+            return None
+        data = graph.to_dict()
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+        return data
+
+    def _read(self, topic):
+        graph = self.journal.read()
+        return graph if graph is not None and graph.core == topic else None
+
+
+def create_graph_store():
+    if Config.GRAPH_STORE == "sqlite":
+        return SQLiteGraphStore()
+    return JSONGraphStore(journaled=Config.GRAPH_STORE == "journal")
+
+
+graph_store = create_graph_store()
@@ -1,42 +1,31 @@
 import json
 import numpy as np
-import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import re
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
 from config import Config
-
-global_data = None
-global_topic = "Machine Learning"
-embedding_model = None
+from modules.graph.concept_graph import ConceptGraph, relationship_key
+from modules.graph.store import graph_store
+from modules.graph.embedding_cache import embedding_cache
+from modules.graph.embedding_model import embedding_loader, EmbeddingModelLoading, EmbeddingUnavailable
+from modules.graph.embedding_worker import embedding_worker
+from modules.graph.vector_index import VectorIndexes
+from modules.graph.layout import radial_layout, place_changed
+from modules.graph.llm_client import llm_client
 
 def load_embedding_model():
-    global embedding_model
-    try:
-        embedding_model = SentenceTransformer("Alibaba-NLP/gte-Qwen2-7B-instruct", device="cpu", trust_remote_code=True)
-        embedding_model.max_seq_length = 512 
-        print("Embedding model loaded successfully on CPU")
-        return True
-    except Exception as e:
-        print(f"Error loading model: {e}")
-        return False
-
-def call_claude_api(prompt, max_tokens=1000):
-    headers = {
-        "x-api-key": Config.CLAUDE_API_KEY,
-        "anthropic-version": "2023-06-01",
-        "content-type": "application/json"
-    }
-    data = {
-        "model": "claude-3-opus-20240229",
-        "max_tokens": max_tokens,
-        "messages": [{"role": "user", "content": prompt}]
-    }
-    
+    # Blocks until the background load finishes; starts it if nobody has.
+    return embedding_loader.get(timeout=None) is not None
+
+def similarity_available():
+    # Starts the background load on first use; never waits for it.
+    embedding_loader.start()
+    return embedding_loader.ready()
+
+def call_claude_api(prompt, max_tokens=1000, timeout=None, cache=False, validate=None):
     try:
-        response = requests.post(Config.CLAUDE_API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()['content'][0]['text']
+        return llm_client.complete(prompt, max_tokens=max_tokens, timeout=timeout, name="graph", cache=cache,
+                                   validate=validate)
     except Exception as e:
         print(f"Claude API error: {e}")
         return None
@@ -47,7 +36,33 @@ def parse_claude_response(response, pattern, default=None):
     match = re.search(pattern, response, re.IGNORECASE)
     return match.group(1) if match else default
 
-def generate_concept_hierarchy(core_topic, depth=3, breadth=5):
+def parse_concept_array(response, fields=("id", "level", "parent")):
+    """The JSON array of concept objects in a reply, or None if there isn't one
+    or an object lacks one of ``fields``."""
+    if not response:
+        return None
+    try:
+        concepts = json.loads(response)
+    except json.JSONDecodeError:
+        match = re.search(r'\[\s*{.*}\s*\]', response, re.DOTALL)
+        if not match:
+            return None
+        try:
+            concepts = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return None
+    
+    if not isinstance(concepts, list) or not all(isinstance(c, dict) and all(f in c for f in fields) for c in concepts):
+        return None
+    return concepts
+
+def is_concept_array(response):
+    return parse_concept_array(response) is not None
+
+def names_parent(response):
+    return parse_claude_response(response, r'PARENT:\s*(.+?)(?:\n|$)') is not None
+
+def generate_concept_hierarchy(core_topic, depth=3, breadth=5, cache=True):
     prompt = f"""
     Generate a concept hierarchy for "{core_topic}" as a JSON array of objects with these fields:
     - "id": concept name (string)
@@ -58,27 +73,91 @@ def generate_concept_hierarchy(core_topic, depth=3, breadth=5):
     Return ONLY the JSON array with no explanation.
     """
     
-    response = call_claude_api(prompt, max_tokens=2000)
+    response = call_claude_api(prompt, max_tokens=2000, cache=cache,
+                               validate=lambda text: parse_concept_array(text, ("id",)) is not None)
     
-    if not response:
+    concepts = parse_concept_array(response, ("id",))
+    if concepts is None:
         return fallback_hierarchy(core_topic)
     
+    if not any(c.get('id') == core_topic and c.get('level') == 0 for c in concepts):
+        concepts.insert(0, {"id": core_topic, "level": 0, "parent": None})
+    
+    return concepts
+
+def generate_hierarchy_batches(core_topic, depth=None, cache=True):
+    """Generate a hierarchy breadth-first, yielding each batch of new concepts.
+
+    The first batch is the root and its children. Every concept is then
+    expanded on a pool of GENERATION_WORKERS threads, two levels per prompt
+    (one if that reaches ``depth``), and each finished expansion is yielded
+    as soon as it arrives. Closing the generator cancels expansions that
+    haven't started.
+    """
+    depth = depth or Config.GENERATION_DEPTH
+    top, error = generate_additional_children(core_topic, core_topic, 0, [], cache)
+    if error or not top:
+        yield generate_concept_hierarchy(core_topic, depth, cache=cache)
+        return
+    
+    levels = {core_topic: 0}
+    
+    def accept(nodes):
+        # A duplicate is dropped with its subtree, rather than merged into the
+        # concept of the same name elsewhere.
+        accepted, dropped = [], set()
+        for node in nodes:
+            if not isinstance(node, dict):
+                continue
+            concept_id, parent = node.get("id"), node.get("parent")
+            if not isinstance(concept_id, str) or not concept_id.strip():
+                continue
+            if not isinstance(parent, str) or parent not in levels or parent in dropped or concept_id in levels or levels[parent] >= depth \
+                    or len(levels) >= Config.GENERATION_MAX_CONCEPTS:
+                dropped.add(concept_id)
+                continue
+            levels[concept_id] = levels[parent] + 1
+            accepted.append({"id": concept_id, "level": levels[concept_id], "parent": parent})
+        return accepted
+    
+    def expand(concept_id):
+        level = levels[concept_id]
+        if level + 2 <= depth:
+            return generate_concept_subtree(core_topic, concept_id, level, [], cache)
+        return generate_additional_children(core_topic, concept_id, level, [], cache)
+    
+    executor = ThreadPoolExecutor(max_workers=Config.GENERATION_WORKERS, thread_name_prefix="generate")
+    pending = set()
+    
+    def schedule(batch):
+        parents = {node["parent"] for node in batch}
+        for node in batch:
+            if node["id"] not in parents and node["level"] < depth:
+                pending.add(executor.submit(expand, node["id"]))
+    
     try:
-        concepts = json.loads(response)
-        
-        if not any(c.get('id') == core_topic and c.get('level') == 0 for c in concepts):
-            concepts.insert(0, {"id": core_topic, "level": 0, "parent": None})
-        
-        return concepts
-    except json.JSONDecodeError:
-        match = re.search(r'\[\s*{.*}\s*\]', response, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(0))
-            except:
-                pass
-        
-        return fallback_hierarchy(core_topic)
+        batch = [{"id": core_topic, "level": 0, "parent": None}] + accept(top)
+        schedule(batch)
+        yield batch
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                try:
+                    nodes, error = future.result()
+                except Exception as e:
+                    nodes, error = [], str(e)
+                if error:
+                    print(f"Expansion failed while generating '{core_topic}': {error}")
+                batch = accept(nodes) if not error else []
+                if batch:
+                    schedule(batch)
+                    yield batch
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 def fallback_hierarchy(core_topic):
     return [
@@ -86,75 +165,95 @@ def fallback_hierarchy(core_topic):
     ]
 
 def compute_embeddings(texts, is_query=False):
-    global embedding_model
+    prompt_name = "query" if is_query else None
+    if Config.EMBEDDING_CACHE_ENABLED:
+        cached = embedding_cache.get_many(texts, prompt_name)
+    else:
+        cached = [None] * len(texts)
+    
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+    if not missing:
+        return np.vstack(cached)
     
-    if embedding_model is None:
-        if not load_embedding_model():
-            return np.random.randn(len(texts), 768)
+    if embedding_loader.get() is None:
+        if embedding_loader.state == "loading":
+            raise EmbeddingModelLoading(f"{embedding_loader.model_name} is still loading")
+        raise EmbeddingUnavailable(f"{embedding_loader.model_name} is not available: {embedding_loader.error}")
     
     try:
-        batch_size = 8
-        all_embeddings = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i+batch_size]
-            if is_query:
-                batch_embeddings = embedding_model.encode(batch, prompt_name="query")
-            else:
-                batch_embeddings = embedding_model.encode(batch)
-            all_embeddings.append(batch_embeddings)
-        
-        return np.vstack(all_embeddings)
+        encoded = embedding_worker.encode(missing, prompt_name)
     except Exception as e:
         print(f"Embedding error: {e}")
-        return np.random.randn(len(texts), 768)
-
-def find_most_similar_concept(new_concept, concepts):
-    concept_ids = [c["id"] for c in concepts]
+        raise EmbeddingUnavailable(str(e)) from e
     
-    new_embedding = compute_embeddings([new_concept], is_query=True)
-    concept_embeddings = compute_embeddings(concept_ids)
+    if Config.EMBEDDING_CACHE_ENABLED:
+        try:
+            embedding_cache.put_many(missing, encoded, prompt_name)
+        except OSError as e:
+            print(f"Embedding cache write error: {e}")
     
-    similarities = (new_embedding @ concept_embeddings.T)[0]
-    max_index = np.argmax(similarities)
+    by_text = dict(zip(missing, encoded))
+    return np.vstack([vector if vector is not None else by_text[text] for text, vector in zip(texts, cached)])
+
+vector_indexes = VectorIndexes(compute_embeddings)
+
+def find_most_similar_concept(new_concept, graph):
+    matches = vector_indexes.nearest(graph, new_concept, k=1, exclude=(new_concept,))
+    if not matches:
+        return None, None
     
-    return concepts[max_index], float(similarities[max_index] * 100)
+    concept_id, similarity = matches[0]
+    return graph.get(concept_id), similarity
 
-def calculate_similarities(concepts, existing_relationships=None):
-    similarities = existing_relationships or {}
-    parent_child_pairs = {}
-    pairs_to_calculate = []
+def edge_similarities(pairs):
+    """Similarity (0-100) of each (source, target) pair.
     
-    for concept in concepts:
-        if concept.get("parent"):
-            parent = concept["parent"]
-            child = concept["id"]
-            pair_key = f"{parent}->{child}"
-            
-            if pair_key not in similarities:
-                if parent not in parent_child_pairs:
-                    parent_child_pairs[parent] = []
-                parent_child_pairs[parent].append(child)
-                pairs_to_calculate.append(pair_key)
-    
-    if not pairs_to_calculate:
-        return similarities
-        
-    for parent, children in parent_child_pairs.items():
-        parent_embedding = compute_embeddings([parent])[0]
-        children_embeddings = compute_embeddings(children)
-        
-        for i, child in enumerate(children):
-            pair_key = f"{parent}->{child}"
-            if pair_key in pairs_to_calculate:  
-                similarity = float((parent_embedding @ children_embeddings[i]) * 100)
-                similarities[pair_key] = similarity
-    
-    return similarities
-
-def get_parent_for_concept(core_topic, new_concept, concepts):
+    The distinct endpoint texts are encoded in one batch and L2-normalized,
+    then every pair is scored by a single row-wise dot product.
+    """
+    if not pairs:
+        return []
+    
+    texts = list(dict.fromkeys(text for pair in pairs for text in pair))
+    vectors = compute_embeddings(texts).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1, norms)
+    
+    row = {text: i for i, text in enumerate(texts)}
+    sources = vectors[[row[source] for source, _ in pairs]]
+    targets = vectors[[row[target] for _, target in pairs]]
+    return (np.einsum('ij,ij->i', sources, targets) * 100).tolist()
+
+def score_edges(graph, pairs):
+    """Compute and store the similarity of each (parent, child) pair in one pass."""
+    pairs = [(source, target) for source, target in pairs if source and target]
+    if not pairs or not similarity_available():
+        return
+    
+    try:
+        scores = edge_similarities(pairs)
+    except EmbeddingUnavailable:
+        return
+    except Exception as e:
+        print(f"Error calculating similarity: {e}")
+        scores = [70.0] * len(pairs)
+    
+    for (source, target), score in zip(pairs, scores):
+        graph.set_similarity(source, target, score)
+
+def score_missing_edges(graph):
+    pairs = [(parent, concept_id) for concept_id, _, parent, similarity in graph.rows()
+             if parent and similarity is None]
+    score_edges(graph, pairs)
+    return len(pairs)
+
+def concept_similarities(concepts):
+    pairs = list(dict.fromkeys((concept["parent"], concept["id"]) for concept in concepts if concept.get("parent")))
+    return [(parent, child, similarity) for (parent, child), similarity in zip(pairs, edge_similarities(pairs))]
+
+def get_parent_for_concept(core_topic, new_concept, graph):
     concepts_by_level = {}
-    for c in concepts:
+    for c in graph.concepts:
         level = c.get("level", 0)
         if level not in concepts_by_level:
             concepts_by_level[level] = []
@@ -175,7 +274,7 @@ def get_parent_for_concept(core_topic, new_concept, concepts):
     LEVEL: [number]
     """
     
-    response = call_claude_api(prompt, max_tokens=300)
+    response = call_claude_api(prompt, max_tokens=300, cache=True, validate=names_parent)
     
     parent = parse_claude_response(response, r'PARENT:\s*(.+?)(?:\n|$)', core_topic)
     
@@ -184,16 +283,16 @@ def get_parent_for_concept(core_topic, new_concept, concepts):
     except (TypeError, ValueError):
         level = 1
     
-    if not any(c["id"] == parent for c in concepts):
+    if parent not in graph:
         import difflib
-        matches = difflib.get_close_matches(parent, [c["id"] for c in concepts], n=1)
+        matches = difflib.get_close_matches(parent, list(graph.ids()), n=1)
         parent = matches[0] if matches else core_topic
     
     return parent, level
 
-def find_best_parent_for_term(core_topic, new_term, concepts):
+def find_best_parent_for_term(core_topic, new_term, graph):
     concepts_by_level = {}
-    for c in concepts:
+    for c in graph.concepts:
         level = c.get("level", 0)
         if level not in concepts_by_level:
             concepts_by_level[level] = []
@@ -221,7 +320,7 @@ def find_best_parent_for_term(core_topic, new_term, concepts):
     REASON: [brief explanation of why this parent is appropriate]
     """
     
-    response = call_claude_api(prompt, max_tokens=500)
+    response = call_claude_api(prompt, max_tokens=500, cache=True, validate=names_parent)
     
     if not response:
         return core_topic, 1, "Defaulting to core topic as parent due to API error."
@@ -235,56 +334,159 @@ def find_best_parent_for_term(core_topic, new_term, concepts):
     
     reason = parse_claude_response(response, r'REASON:\s*(.+?)(?:\n|$)', "")
     
-    if not any(c["id"] == parent for c in concepts):
+    if parent not in graph:
         import difflib
-        matches = difflib.get_close_matches(parent, [c["id"] for c in concepts], n=1)
+        matches = difflib.get_close_matches(parent, list(graph.ids()), n=1)
         parent = matches[0] if matches else core_topic
     
     return parent, level, reason
 
-def expand_node(graph_data, node_id, calculate_similarity=False):
-    core_topic = graph_data["core"]
-    concepts = graph_data["concepts"]
+def rank_parent_candidates(graph, new_term):
+    """Nearest concepts to ``new_term`` as parent candidates, best first.
     
-    node_to_expand = next((c for c in concepts if c["id"] == node_id), None)
-    if not node_to_expand:
-        return graph_data, False, [], "Node not found"
+    The score is the embedding similarity (0-100) nudged by structure:
+    concepts that already have children are likelier parents, and each
+    level of depth costs a little so broad matches beat deep ones on ties.
+    """
+    if not similarity_available():
+        return []
     
-    is_leaf = not any(c.get("parent") == node_id for c in concepts)
+    try:
+        matches = vector_indexes.nearest(graph, new_term, Config.PLACEMENT_CANDIDATES, exclude=(new_term,))
+    except EmbeddingUnavailable as e:
+        print(f"Embedding placement unavailable: {e}")
+        return []
+    
+    candidates = []
+    for concept_id, similarity in matches:
+        level = graph.level_of(concept_id)
+        level = level if isinstance(level, int) else 0
+        child_count = graph.child_count(concept_id)
+        score = similarity + (3.0 if child_count else 0.0) - 1.0 * level
+        candidates.append({
+            "id": concept_id,
+            "level": level,
+            "child_count": child_count,
+            "similarity": round(similarity, 2),
+            "score": round(score, 2)
+        })
+    
+    candidates.sort(key=lambda c: c["score"], reverse=True)
+    return candidates
+
+def place_term(core_topic, new_term, graph):
+    """Choose a parent for ``new_term``; returns (parent, level, reason, placement).
     
-    existing_children = [c["id"] for c in concepts if c.get("parent") == node_id]
+    With ``Config.TERM_PLACEMENT = "embedding"`` the best-ranked candidate is
+    used directly when it is similar enough and leads the runner-up by
+    ``PLACEMENT_MARGIN``. Otherwise Claude picks among the top candidates
+    only. ``placement["path"]`` records which way the decision was made.
+    """
+    candidates = rank_parent_candidates(graph, new_term) if Config.TERM_PLACEMENT == "embedding" else []
+    placement = {"path": None, "margin": None, "candidates": candidates}
+    
+    if not candidates:
+        parent, level, reason = find_best_parent_for_term(core_topic, new_term, graph)
+        placement["path"] = "llm"
+        return parent, level, reason, placement
+    
+    best = candidates[0]
+    margin = best["score"] - candidates[1]["score"] if len(candidates) > 1 else best["score"]
+    placement["margin"] = round(margin, 2)
+    
+    if best["similarity"] >= Config.PLACEMENT_MIN_SIMILARITY and margin >= Config.PLACEMENT_MARGIN:
+        placement["path"] = "embedding"
+        reason = f"Closest in meaning ({best['similarity']:.0f}% similar)"
+        return best["id"], best["level"] + 1, reason, placement
+    
+    parent, reason = choose_parent_from_candidates(core_topic, new_term, candidates)
+    if parent is None:
+        placement["path"] = "embedding-after-llm-failure"
+        if best["similarity"] < Config.PLACEMENT_MIN_SIMILARITY:
+            return core_topic, 1, "Defaulting to core topic as parent due to API error.", placement
+        return best["id"], best["level"] + 1, f"Closest in meaning ({best['similarity']:.0f}% similar)", placement
+    
+    placement["path"] = "llm-candidates"
+    level = next(c["level"] for c in candidates if c["id"] == parent) + 1
+    return parent, level, reason, placement
+
+def choose_parent_from_candidates(core_topic, new_term, candidates):
+    formatted = "\n".join(f"- {c['id']} (level {c['level']})" for c in candidates)
     
-    if is_leaf:
-        new_nodes, error = generate_concept_subtree(core_topic, node_id, node_to_expand.get("level", 0), existing_children)
-    else:
-        new_nodes, error = generate_additional_children(core_topic, node_id, node_to_expand.get("level", 0), existing_children)
+    prompt = f"""
+    For a knowledge graph about "{core_topic}", I want to add a new concept: "{new_term}"
+    
+    These existing concepts are the closest matches:
+    {formatted}
+    
+    Which ONE of them should be the PARENT of the new concept?
+    
+    Respond exactly as:
+    PARENT: [one of the concepts above]
+    REASON: [brief explanation of why this parent is appropriate]
+    """
+    
+    ids = [c["id"] for c in candidates]
+    
+    def chosen(response):
+        parent = parse_claude_response(response, r'PARENT:\s*(.+?)(?:\n|$)')
+        if parent not in ids:
+            import difflib
+            matches = difflib.get_close_matches(parent or "", ids, n=1)
+            parent = matches[0] if matches else None
+        return parent
     
+    response = call_claude_api(prompt, max_tokens=300, timeout=Config.PLACEMENT_LLM_TIMEOUT, cache=True,
+                               validate=lambda text: chosen(text) is not None)
+    if not response:
+        return None, None
+    
+    reason = parse_claude_response(response, r'REASON:\s*(.+?)(?:\n|$)', "")
+    return chosen(response), reason
+
+def expand_node(graph, node_id, calculate_similarity=False):
+    new_nodes, error = generate_expansion(graph, node_id)
     if error:
-        return graph_data, False, [], error
+        return graph, False, [], error
+    
+    return apply_expansion(graph, node_id, new_nodes, calculate_similarity)
+
+def generate_expansion(graph, node_id, cache=True):
+    core_topic = graph.core
+    
+    node_to_expand = graph.get(node_id)
+    if not node_to_expand:
+        return [], "Node not found"
+    
+    existing_children = graph.children_of(node_id)
+    is_leaf = not existing_children
     
+    if is_leaf:
+        return generate_concept_subtree(core_topic, node_id, node_to_expand.get("level", 0), existing_children, cache)
+    else:
+        return generate_additional_children(core_topic, node_id, node_to_expand.get("level", 0), existing_children, cache)
+
+def apply_expansion(graph, node_id, new_nodes, calculate_similarity=False):
+    if node_id not in graph:
+        return graph, False, [], "Node not found"
+    
+    added_ids = []
     for new_node in new_nodes:
-        concepts.append(new_node)
-        
-        if calculate_similarity and "relationships" in graph_data:
-            parent_id = new_node.get("parent")
-            if parent_id:
-                key = f"{parent_id}->{new_node['id']}"
-                try:
-                    parent_embedding = compute_embeddings([parent_id])[0]
-                    node_embedding = compute_embeddings([new_node['id']])[0]
-                    similarity = float((parent_embedding @ node_embedding) * 100)
-                    graph_data["relationships"][key] = similarity
-                except Exception as e:
-                    print(f"Error calculating similarity: {e}")
-                    graph_data["relationships"][key] = 70.0
+        concept_id, parent = new_node["id"], new_node.get("parent")
+        # Children whose parent isn't in the graph (yet) are skipped.
+        if not isinstance(concept_id, str) or not isinstance(parent, str) or concept_id in graph or parent not in graph:
+            continue
+        graph.add(concept_id, parent, new_node.get("level"))
+        added_ids.append(concept_id)
+    
+    if calculate_similarity:
+        score_edges(graph, [(graph.parent_of(concept_id), concept_id) for concept_id in added_ids])
     
-    with open(Config.GRAPH_DATA_FILE, 'w') as f:
-        json.dump(graph_data, f, indent=2)
+    save_graph(graph)
     
-    new_node_ids = [n["id"] for n in new_nodes]
-    return graph_data, True, new_node_ids, None
+    return graph, True, added_ids, None
 
-def generate_concept_subtree(core_topic, parent_id, parent_level, existing_children):
+def generate_concept_subtree(core_topic, parent_id, parent_level, existing_children, cache=True):
     existing_formatted = "\n".join([f"- {child}" for child in existing_children])
     exclusion_text = f"Existing children to exclude:\n{existing_formatted}" if existing_children else ""
     
@@ -305,30 +507,18 @@ def generate_concept_subtree(core_topic, parent_id, parent_level, existing_child
     Return ONLY the JSON array without any explanation or markdown formatting.
     """
     
-    response = call_claude_api(prompt, max_tokens=2000)
+    response = call_claude_api(prompt, max_tokens=2000, cache=cache, validate=is_concept_array)
     
     if not response:
         return [], "Failed to generate subtree"
     
-    try:
-        new_nodes = json.loads(response)
-        
-        for node in new_nodes:
-            if not all(key in node for key in ["id", "level", "parent"]):
-                return [], "Invalid node structure in generated concepts"
-        
-        return new_nodes, None
-    except json.JSONDecodeError:
-        match = re.search(r'\[\s*{.*}\s*\]', response, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(0)), None
-            except:
-                pass
-        
+    new_nodes = parse_concept_array(response)
+    if new_nodes is None:
         return [], "Failed to parse generated concepts"
+    
+    return new_nodes, None
 
-def generate_additional_children(core_topic, parent_id, parent_level, existing_children):
+def generate_additional_children(core_topic, parent_id, parent_level, existing_children, cache=True):
     existing_formatted = "\n".join([f"- {child}" for child in existing_children])
     
     prompt = f"""
@@ -350,261 +540,257 @@ def generate_additional_children(core_topic, parent_id, parent_level, existing_c
     Return ONLY the JSON array without any explanation or markdown formatting.
     """
     
-    response = call_claude_api(prompt, max_tokens=1000)
+    response = call_claude_api(prompt, max_tokens=1000, cache=cache, validate=is_concept_array)
     
     if not response:
         return [], "Failed to generate additional children"
     
-    try:
-        new_nodes = json.loads(response)
-        
-        for node in new_nodes:
-            if not all(key in node for key in ["id", "level", "parent"]):
-                return [], "Invalid node structure in generated concepts"
-            
-            if node["parent"] != parent_id:
-                node["parent"] = parent_id
-            
-            if node["level"] != parent_level + 1:
-                node["level"] = parent_level + 1
-        
-        return new_nodes, None
-    except json.JSONDecodeError:
-        match = re.search(r'\[\s*{.*}\s*\]', response, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(0)), None
-            except:
-                pass
-        
+    new_nodes = parse_concept_array(response)
+    if new_nodes is None:
         return [], "Failed to parse generated concepts"
+    
+    for node in new_nodes:
+        node["parent"] = parent_id
+        node["level"] = parent_level + 1
+    
+    return new_nodes, None
+
+def save_graph(graph):
+    positions = place_changed(graph)
+    if positions:
+        graph.set_positions(positions)
+    graph_store.commit(graph)
 
 def build_or_load_graph(core_topic, force_regenerate=False, calculate_similarities=False):
-    if not force_regenerate and Config.GRAPH_DATA_FILE.exists():
+    if not force_regenerate:
         try:
-            with open(Config.GRAPH_DATA_FILE, 'r') as f:
-                data = json.load(f)
-                if data.get("core") == core_topic:
-                    return data
-        except:
-            pass
-    
-    concepts = generate_concept_hierarchy(core_topic)
+            graph = graph_store.load(core_topic)
+            if graph is not None:
+                graph_store.set_active_topic(core_topic)
+                return graph
+        except Exception as e:
+            print(f"Error loading graph: {e}")
     
-    if calculate_similarities:
-        similarities = calculate_similarities(concepts)
-    else:
-        similarities = {}
+    # A forced regeneration asks for a fresh hierarchy rather than the cached one.
+    concepts = [concept for batch in generate_hierarchy_batches(core_topic, cache=not force_regenerate)
+                for concept in batch]
     
-    graph_data = {
-        "core": core_topic,
-        "concepts": concepts,
-        "relationships": similarities
-    }
+    similarities = []
+    if calculate_similarities and similarity_available():
+        try:
+            similarities = concept_similarities(concepts)
+        except EmbeddingUnavailable as e:
+            print(f"Skipping similarities: {e}")
     
-    with open(Config.GRAPH_DATA_FILE, 'w') as f:
-        json.dump(graph_data, f, indent=2)
+    graph = ConceptGraph(core_topic, concepts, similarities)
+    layout_graph(graph)
+    graph_store.save(graph)
+    graph_store.set_active_topic(core_topic)
     
-    return graph_data
+    return graph
+
+def layout_graph(graph):
+    # Siblings are ordered along the topic's first embedding principal
+    # component when the model is up, so similar concepts start out close.
+    projection = None
+    if similarity_available():
+        index = vector_indexes.get(graph.core)
+        try:
+            index.sync(graph)
+            projection = index.principal_projection()
+        except EmbeddingUnavailable as e:
+            print(f"Laying out '{graph.core}' without embeddings: {e}")
+    graph.set_positions(radial_layout(graph, projection))
 
-def add_concept(graph_data, new_concept, parent_id=None, level=None, calculate_similarity=False):
-    core_topic = graph_data["core"]
-    concepts = graph_data["concepts"]
+def add_concept(graph, new_concept, parent_id=None, level=None, calculate_similarity=False):
+    core_topic = graph.core
     
-    if any(c["id"] == new_concept for c in concepts):
-        return graph_data, False
+    if new_concept in graph:
+        return graph, False
     
     if parent_id is None or level is None:
-        parent_id, level = get_parent_for_concept(core_topic, new_concept, concepts)
+        parent_id, level = get_parent_for_concept(core_topic, new_concept, graph)
     
-    concepts.append({
-        "id": new_concept,
-        "level": level,
-        "parent": parent_id
-    })
+    # The graph would otherwise intern an unknown parent as a name with no
+    # concept behind it, leaving the new concept unreachable.
+    if parent_id is not None and parent_id not in graph:
+        raise ValueError(f"Parent concept '{parent_id}' does not exist")
     
-    if "relationships" not in graph_data:
-        graph_data["relationships"] = {}
+    graph.add(new_concept, parent_id, level)
     
-    if calculate_similarity:
-        new_relationship_key = f"{parent_id}->{new_concept}"
-        if new_relationship_key not in graph_data["relationships"]:
-            try:
-                parent_embedding = compute_embeddings([parent_id])[0]
-                concept_embedding = compute_embeddings([new_concept])[0]
-                similarity = float((parent_embedding @ concept_embedding) * 100)
-                graph_data["relationships"][new_relationship_key] = similarity
-            except Exception as e:
-                print(f"Error calculating similarity: {e}")
-                graph_data["relationships"][new_relationship_key] = 70.0
-    
-    with open(Config.GRAPH_DATA_FILE, 'w') as f:
-        json.dump(graph_data, f, indent=2)
-    
-    return graph_data, True
-
-def delete_concept(graph_data, concept_id):
-    concepts = graph_data["concepts"]
-    relationships = graph_data.get("relationships", {})
-    
-    concept_to_delete = next((c for c in concepts if c["id"] == concept_id), None)
-    if not concept_to_delete:
-        return graph_data, False
-    
-    to_delete = set([concept_id])
-    
-    while True:
-        found = False
-        for concept in concepts:
-            if concept.get("parent") in to_delete and concept["id"] not in to_delete:
-                to_delete.add(concept["id"])
-                found = True
-        if not found:
-            break
-    
-    concepts[:] = [c for c in concepts if c["id"] not in to_delete]
-    
-    relationships_to_keep = {}
-    for key, value in relationships.items():
-        source, target = key.split("->")
-        if source not in to_delete and target not in to_delete:
-            relationships_to_keep[key] = value
-    graph_data["relationships"] = relationships_to_keep
-    
-    with open(Config.GRAPH_DATA_FILE, 'w') as f:
-        json.dump(graph_data, f, indent=2)
-    
-    return graph_data, True
-
-def rename_concept(graph_data, old_id, new_id):
-    concepts = graph_data["concepts"]
-    relationships = graph_data.get("relationships", {})
-    
-    if any(c["id"] == new_id for c in concepts):
-        return graph_data, False
-    
-    concept = next((c for c in concepts if c["id"] == old_id), None)
-    if not concept:
-        return graph_data, False
-    
-    concept["id"] = new_id
-    
-    for c in concepts:
-        if c.get("parent") == old_id:
-            c["parent"] = new_id
-    
-    new_relationships = {}
-    for k, v in relationships.items():
-        source, target = k.split("->")
-        
-        if source == old_id:
-            source = new_id
-        if target == old_id:
-            target = new_id
-            
-        new_relationships[f"{source}->{target}"] = v
+    if calculate_similarity and graph.similarity(parent_id, new_concept) is None:
+        score_edges(graph, [(parent_id, new_concept)])
     
-    graph_data["relationships"] = new_relationships
+    save_graph(graph)
     
-    with open(Config.GRAPH_DATA_FILE, 'w') as f:
-        json.dump(graph_data, f, indent=2)
+    return graph, True
+
+def delete_concept(graph, concept_id):
+    if concept_id not in graph:
+        return graph, False
+    
+    to_delete = [concept_id] + graph.descendants(concept_id)
+    graph.remove(to_delete)
     
-    return graph_data, True
+    save_graph(graph)
+    
+    return graph, True
 
-def insert_node_between(graph_data, parent_id, child_id, new_concept, calculate_similarity=False):
-    concepts = graph_data["concepts"]
+def rename_concept(graph, old_id, new_id):
+    if new_id in graph or old_id not in graph:
+        return graph, False
     
-    if "relationships" not in graph_data:
-        graph_data["relationships"] = {}
-    relationships = graph_data["relationships"]
+    graph.rename(old_id, new_id)
     
-    if any(c["id"] == new_concept for c in concepts):
-        return graph_data, False
+    save_graph(graph)
     
-    parent = next((c for c in concepts if c["id"] == parent_id), None)
-    child = next((c for c in concepts if c["id"] == child_id), None)
+    return graph, True
+
+def insert_node_between(graph, parent_id, child_id, new_concept, calculate_similarity=False):
+    if new_concept in graph:
+        return graph, False
     
-    if not parent or not child:
-        return graph_data, False
+    parent = graph.get(parent_id)
+    child = graph.get(child_id)
     
-    new_level = parent.get("level", 0) + 1
+    if not parent or not child:
+        return graph, False
     
-    if child.get("level", 0) <= new_level:
-        child["level"] = new_level + 1
+    # Only a hierarchy edge can be split. Checking before any change also
+    # rules out a cycle, since the new concept sits on the existing edge.
+    if graph.parent_of(child_id) != parent_id:
+        return graph, False
     
-    concepts.append({
-        "id": new_concept,
-        "level": new_level,
-        "parent": parent_id
-    })
+    new_level = parent.get("level", 0) + 1
     
-    old_key = f"{parent_id}->{child_id}"
-    old_similarity = relationships.get(old_key)
+    graph.add(new_concept, parent_id, new_level)
     
-    child["parent"] = new_concept
+    child_level = child["level"] if child.get("level", 0) > new_level else new_level + 1
+    graph.set_parent(child_id, new_concept, child_level)
     
     if calculate_similarity:
-        parent_new_key = f"{parent_id}->{new_concept}"
-        new_child_key = f"{new_concept}->{child_id}"
-        
-        try:
-            parent_embedding = compute_embeddings([parent_id])[0]
-            new_concept_embedding = compute_embeddings([new_concept])[0]
-            parent_new_similarity = float((parent_embedding @ new_concept_embedding) * 100)
-            relationships[parent_new_key] = parent_new_similarity
-            
-            child_embedding = compute_embeddings([child_id])[0]
-            new_child_similarity = float((new_concept_embedding @ child_embedding) * 100)
-            relationships[new_child_key] = new_child_similarity
-        except Exception as e:
-            print(f"Error calculating similarity: {e}")
-            relationships[parent_new_key] = 70.0
-            relationships[new_child_key] = 70.0  
+        score_edges(graph, [(parent_id, new_concept), (new_concept, child_id)])
     
-    if old_key in relationships:
-        del relationships[old_key]
+    graph.drop_similarity(parent_id, child_id)
     
-    with open(Config.GRAPH_DATA_FILE, 'w') as f:
-        json.dump(graph_data, f, indent=2)
+    save_graph(graph)
     
-    return graph_data, True
+    return graph, True
 
-def prepare_d3_data(graph_data, using_similarities=False):
-    concepts = graph_data["concepts"]
-    relationships = graph_data.get("relationships", {})
-    
-    nodes = [{"id": c["id"], "level": c.get("level", 0), "group": c.get("level", 0)} 
-             for c in concepts]
-    
+def d3_node(concept_id, level, position=None):
+    level = level if level is not None else 0
+    node = {"id": concept_id, "level": level, "group": level}
+    if position is not None:
+        node["x"], node["y"] = position
+    return node
+
+def d3_link(source, target, similarity=None):
+    if similarity is not None:
+        dissonance = (100 - similarity) / 100
+        line_type = "dotted" if dissonance > 0.3 else "solid"
+    else:
+        dissonance = 0.3
+        line_type = "solid"
+    
+    return {
+        "source": source,
+        "target": target,
+        "similarity": similarity / 100 if similarity is not None else None,  
+        "dissonance": dissonance,
+        "value": dissonance,  
+        "line_type": line_type,
+        "key": relationship_key(source, target)  
+    }
+
+def d3_related_link(source, target, similarity):
+    return {
+        "source": source,
+        "target": target,
+        "similarity": similarity / 100,
+        "line_type": "related",
+        "key": f"{source}~{target}"
+    }
+
+def related_links(nodes, related_edges):
+    shown = {node["id"] for node in nodes}
+    return [d3_related_link(a, b, similarity) for a, b, similarity in related_edges if a in shown and b in shown]
+
+def prepare_d3_data(graph, using_similarities=False, max_depth=None, max_children=None, related_edges=None):
+    """Nodes and parent links for D3. ``related_edges`` (a, b, similarity)
+    between shown nodes are added as ``related_links``."""
+    if max_depth is not None or max_children is not None:
+        data = prepare_d3_subtree(graph, graph.roots(), using_similarities, max_depth, max_children)
+    else:
+        nodes = []
+        links = []
+        for concept_id, level, parent, similarity in graph.rows():
+            nodes.append(d3_node(concept_id, level, graph.position(concept_id)))
+            if parent:
+                links.append(d3_link(parent, concept_id, similarity if using_similarities else None))
+        data = {"nodes": nodes, "links": links}
+    
+    if related_edges is not None:
+        data["related_links"] = related_links(data["nodes"], related_edges)
+    return data
+
+def prepare_d3_subtree(graph, start_ids, using_similarities=False, max_depth=None, max_children=None,
+                       link_to_parent=False):
+    """Walk breadth-first from ``start_ids`` down ``max_depth`` levels, at most
+    ``max_children`` children per node. Only the nodes returned are visited.
+    Each node carries ``child_count`` and, if some children were left out,
+    ``hidden_children`` and the ``next_cursor`` for /children."""
+    nodes = []
     links = []
-    for c in concepts:
-        if c.get("parent"):
-            source = c["parent"]
-            target = c["id"]
-            key = f"{source}->{target}"
+    frontier = list(start_ids)
+    depth = 0
+    while frontier:
+        expand = max_depth is None or depth < max_depth
+        next_frontier = []
+        for concept_id in frontier:
+            _, level, parent, similarity = graph.row(concept_id)
+            child_count = graph.child_count(concept_id)
+            shown = graph.children_page(concept_id, limit=max_children)[0] if expand and child_count else []
             
-            if using_similarities:
-                if key in relationships:
-                    similarity = relationships[key]
-                    dissonance = (100 - similarity) / 100
-                    line_type = "dotted" if dissonance > 0.3 else "solid"
-                else:
-                    similarity = None  
-                    dissonance = 0.3   
-                    line_type = "solid"
-            else:
-                similarity = None
-                dissonance = 0.3
-                line_type = "solid"
+            node = d3_node(concept_id, level, graph.position(concept_id))
+            node["child_count"] = child_count
+            node["hidden_children"] = child_count - len(shown)
+            node["next_cursor"] = shown[-1] if shown and len(shown) < child_count else None
+            nodes.append(node)
             
-            links.append({
-                "source": source,
-                "target": target,
-                "similarity": similarity / 100 if similarity is not None else None,  
-                "dissonance": dissonance,
-                "value": dissonance,  
-                "line_type": line_type,
-                "key": key  
-            })
+            if parent and (depth > 0 or link_to_parent):
+                links.append(d3_link(parent, concept_id, similarity if using_similarities else None))
+            next_frontier.extend(shown)
+        frontier = next_frontier
+        depth += 1
     
     return {"nodes": nodes, "links": links}
+
+def prepare_d3_delta(graph, client_version, using_similarities=False):
+    changes = graph.changes_since(client_version)
+    if changes is None:
+        return None
+    
+    changed = changes["added"] + changes["updated"]
+    listed = set(changed)
+    # A new concept adopts concepts left pointing at its name (orphans in
+    # older files), so the client is missing their links too.
+    changed += [child for concept_id in changes["added"] for child in graph.children_of(concept_id)
+                if child not in listed]
+    
+    nodes = []
+    links = []
+    for concept_id in changed:
+        level, parent = graph.level_of(concept_id), graph.parent_of(concept_id)
+        nodes.append(d3_node(concept_id, level, graph.position(concept_id)))
+        if parent:
+            similarity = graph.similarity(parent, concept_id) if using_similarities else None
+            links.append(d3_link(parent, concept_id, similarity))
+    
+    return {
+        "from_version": client_version,
+        "version": graph.version,
+        "removed": changes["removed"],
+        "renamed": changes["renamed"],
+        "nodes": nodes,
+        "links": links
+    }
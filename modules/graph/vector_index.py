@@ -0,0 +1,277 @@
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import Config
+from modules.graph.embedding_model import EmbeddingModelLoading
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+
+class VectorIndexWarming(EmbeddingModelLoading):
+    """Raised by queries while a topic's index is being built in the background."""
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class VectorIndex:
+    """Normalized embedding of every concept in one topic, for nearest-concept queries.
+
+    Rows live in a growable float32 matrix; a removed row is filled with the
+    last one so the live rows stay contiguous. ``sync`` brings the index up
+    to a graph version using the graph's change history, so only added and
+    renamed concepts are embedded. Queries scan the matrix in blocks of
+    ``VECTOR_INDEX_BLOCK_ROWS``; with faiss installed, topics of at least
+    ``VECTOR_INDEX_ANN_MIN_CONCEPTS`` use an HNSW index instead, and
+    concepts added since it was built are scanned exactly.
+
+    An index that has never been synced is cold: ``warm`` builds it on a
+    background thread, as EmbeddingModelLoader loads the model, so the
+    request that finds it cold doesn't embed the whole topic.
+    """
+
+    def __init__(self, topic, embed):
+        self.topic = topic
+        self.embed = embed
+        self.version = None
+        self.ids = []
+        self._row = {}
+        self._matrix = None
+        self._ann = None
+        self._ann_ids = []
+        self._ann_pending = set()
+        self._ann_stale = 0
+        self._warming = None
+        self._warm_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sync(self, graph):
+        with self._lock:
+            if self.version == graph.version:
+                return
+            changes = graph.changes_since(self.version) if self.version is not None else None
+            if changes is not None:
+                removed = changes["removed"] + [old_id for old_id, _ in changes["renamed"]]
+                added = changes["added"] + [new_id for _, new_id in changes["renamed"]]
+            else:
+                current = set(graph.ids())
+                removed = [concept_id for concept_id in self.ids if concept_id not in current]
+                added = [concept_id for concept_id in current if concept_id not in self._row]
+
+            try:
+                self._remove(removed)
+                self._add(added)
+            except Exception:
+                # The concepts that failed to embed aren't indexed; forgetting
+                # the version makes the next sync diff ids and retry them.
+                self.version = None
+                raise
+            self.version = graph.version
+
+    def warm(self, graph):
+        """True if the index has been synced before. Otherwise start syncing it
+        to ``graph``, which must not change meanwhile (a snapshot), in the
+        background, and return False."""
+        # Not self._lock: a sync holding it may take as long as the build.
+        if self.version is not None:
+            return True
+        with self._warm_lock:
+            if self._warming is None or not self._warming.is_alive():
+                self._warming = threading.Thread(target=self._warm, args=(graph,),
+                                                 name=f"vector-index-{self.topic}", daemon=True)
+                self._warming.start()
+            return False
+
+    def search(self, vector, k=10, exclude=()):
+        """The ``k`` nearest concepts to ``vector`` as (id, similarity 0-100), best first."""
+        vector = normalize_rows(vector)
+        with self._lock:
+            want = min(len(self.ids), k + len(exclude))
+            if want == 0:
+                return []
+            if faiss is not None and len(self.ids) >= Config.VECTOR_INDEX_ANN_MIN_CONCEPTS:
+                rows, scores = self._ann_search(vector, want)
+            else:
+                rows, scores = self._scan(vector, want)
+
+            results = []
+            for row, score in zip(rows, scores):
+                concept_id = self.ids[row]
+                if concept_id not in exclude:
+                    results.append((concept_id, float(score) * 100))
+                if len(results) == k:
+                    break
+            return results
+
+    def score_block(self, ids, version):
+        """Similarity (-1..1) of each of ``ids`` to every indexed concept, with the
+        column ids; None if the index has moved past ``version``."""
+        with self._lock:
+            if self.version != version:
+                return None
+            count = len(self.ids)
+            rows = [self._row[concept_id] for concept_id in ids]
+            return self._matrix[rows] @ self._matrix[:count].T, list(self.ids)
+
+    def principal_projection(self, iterations=8):
+        """Coordinate of every indexed concept along the first principal
+        component (power iteration on the centred matrix, never forming it)."""
+        with self._lock:
+            count = len(self.ids)
+            if count < 3:
+                return {}
+            matrix = self._matrix[:count]
+            mean = matrix.mean(axis=0)
+            direction = np.random.default_rng(0).standard_normal(matrix.shape[1]).astype(np.float32)
+            for _ in range(iterations):
+                direction = matrix.T @ (matrix @ direction) - count * mean * (mean @ direction)
+                direction /= np.linalg.norm(direction) or 1
+            return dict(zip(self.ids, (matrix @ direction - mean @ direction).tolist()))
+
+    def stats(self):
+        return {
+            "concepts": len(self.ids),
+            "dimension": self._matrix.shape[1] if self._matrix is not None else None,
+            "version": self.version,
+            "approximate": self._ann is not None,
+            "warming": self._warming is not None and self._warming.is_alive()
+        }
+
+    def _warm(self, graph):
+        try:
+            self.sync(graph)
+            logger.info(f"Built vector index for '{self.topic}' ({len(self.ids)} concepts)")
+        except Exception as e:
+            logger.warning(f"Building the vector index for '{self.topic}' failed: {e}")
+
+    def _add(self, ids):
+        ids = [concept_id for concept_id in dict.fromkeys(ids) if concept_id not in self._row]
+        if not ids:
+            return
+        vectors = normalize_rows(self.embed(ids))
+
+        if self._matrix is not None and self._matrix.shape[1] != vectors.shape[1]:
+            logger.warning(f"Embedding dimension changed for '{self.topic}'; rebuilding its vector index")
+            self._rebuild(self.ids + ids)
+            return
+
+        count = len(self.ids)
+        if self._matrix is None:
+            self._matrix = np.empty((max(len(ids), 64), vectors.shape[1]), dtype=np.float32)
+        elif count + len(ids) > self._matrix.shape[0]:
+            grown = np.empty((max(count + len(ids), 2 * self._matrix.shape[0]), self._matrix.shape[1]), dtype=np.float32)
+            grown[:count] = self._matrix[:count]
+            self._matrix = grown
+
+        self._matrix[count:count + len(ids)] = vectors
+        for offset, concept_id in enumerate(ids):
+            self._row[concept_id] = count + offset
+        self.ids.extend(ids)
+        if self._ann is not None:
+            self._ann_pending.update(ids)
+
+    def _remove(self, ids):
+        for concept_id in ids:
+            row = self._row.pop(concept_id, None)
+            if row is None:
+                continue
+            last = len(self.ids) - 1
+            if row != last:
+                moved = self.ids[last]
+                self._matrix[row] = self._matrix[last]
+                self.ids[row] = moved
+                self._row[moved] = row
+            self.ids.pop()
+
+            if concept_id in self._ann_pending:
+                self._ann_pending.discard(concept_id)
+            elif self._ann is not None:
+                self._ann_stale += 1
+
+    def _rebuild(self, ids):
+        self.ids, self._row, self._matrix, self._ann = [], {}, None, None
+        self._add(ids)
+
+    def _scan(self, vector, k):
+        count = len(self.ids)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, count, Config.VECTOR_INDEX_BLOCK_ROWS):
+            scores = self._matrix[start:min(count, start + Config.VECTOR_INDEX_BLOCK_ROWS)] @ vector
+            top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_rows) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores)
+        return best_rows[order], best_scores[order]
+
+    def _ann_search(self, vector, k):
+        if self._ann is None or len(self._ann_pending) + self._ann_stale > 0.1 * len(self.ids):
+            self._build_ann()
+
+        # Over-fetch to make up for hits on concepts removed since the build,
+        # then score the candidates exactly against the live matrix.
+        _, labels = self._ann.search(vector[None, :], k + self._ann_stale)
+        candidates = {self._ann_ids[label] for label in labels[0] if label >= 0} | self._ann_pending
+        rows = np.array([self._row[c] for c in candidates if c in self._row], dtype=np.int64)
+        scores = self._matrix[rows] @ vector
+        order = np.argsort(-scores)[:k]
+        return rows[order], scores[order]
+
+    def _build_ann(self):
+        count = len(self.ids)
+        index = faiss.IndexHNSWFlat(self._matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.add(np.ascontiguousarray(self._matrix[:count]))
+        self._ann, self._ann_ids = index, list(self.ids)
+        self._ann_pending, self._ann_stale = set(), 0
+        logger.info(f"Built approximate vector index for '{self.topic}' ({count} concepts)")
+
+
+class VectorIndexes:
+    """Per-topic VectorIndex instances, least recently used dropped first."""
+
+    def __init__(self, embed, max_topics=None):
+        self.embed = embed
+        self.max_topics = max_topics or Config.VECTOR_INDEX_MAX_TOPICS
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, topic):
+        with self._lock:
+            index = self._indexes.get(topic)
+            if index is None:
+                index = self._indexes[topic] = VectorIndex(topic, self.embed)
+            self._indexes.move_to_end(topic)
+            while len(self._indexes) > self.max_topics:
+                self._indexes.popitem(last=False)
+            return index
+
+    def nearest(self, graph, text, k=10, exclude=()):
+        """The ``k`` concepts of ``graph`` nearest to ``text``. A cold index for a
+        topic of more than VECTOR_INDEX_INLINE_MAX concepts raises
+        VectorIndexWarming until its background build is done."""
+        index = self.get(graph.core)
+        if len(graph) > Config.VECTOR_INDEX_INLINE_MAX and not index.warm(graph):
+            raise VectorIndexWarming(f"The vector index for '{graph.core}' is still being built")
+        index.sync(graph)
+        query = self.embed([text], is_query=True)[0]
+        return index.search(query, k, exclude)
+
+    def stats(self):
+        with self._lock:
+            return {topic: index.stats() for topic, index in self._indexes.items()}